@@ -3,6 +3,8 @@ import logging
 
 # Используем общий экземпляр bot и dp из config.py, где они созданы
 from config import bot, dp
+from broadcast import resume_broadcast_jobs, start_broadcast_scheduler, stop_broadcast_jobs
+from database import close_db, init_db
 
 # Импортируем хэндлеры для регистрации событий (они регистрируются при импорте)
 import handlers.start
@@ -14,7 +16,14 @@ import handlers.groups
 async def main():
     logging.basicConfig(level=logging.INFO)
     logging.info("Бот запускается…")
-    await dp.start_polling(bot)
+    await init_db()
+    await resume_broadcast_jobs()
+    start_broadcast_scheduler()
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await stop_broadcast_jobs()
+        await close_db()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,940 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import aiosqlite
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import BOT_TIMEZONE, BROADCAST_MIN_RATE, BROADCAST_RATE, BROADCAST_WORKERS, bot
+from database import (
+    USER_STATUS_BLOCKED,
+    USER_STATUS_DEACTIVATED,
+    cancel_paused_broadcast_job,
+    cancel_scheduled_broadcast_job,
+    checkpoint_broadcast_job,
+    count_audience,
+    create_broadcast_job,
+    fetch_broadcast_job,
+    fetch_broadcast_jobs,
+    fetch_due_broadcast_jobs,
+    finish_broadcast_job,
+    flush_pending_writes,
+    get_active_user_count,
+    get_group_subscriber_count,
+    get_next_broadcast_schedule_time,
+    iter_all_user_id_batches,
+    iter_audience_user_id_batches,
+    iter_group_user_id_batches,
+    iter_sent_broadcast_message_batches,
+    mark_user_inactive,
+    parse_timestamp,
+    record_broadcast_delivery,
+    resume_paused_broadcast_job,
+    set_broadcast_delivery_status,
+    set_broadcast_job_status,
+    start_scheduled_broadcast_job,
+    update_broadcast_job_content,
+)
+from outbound import PRIORITY_BULK, outbound_priority
+from ratelimit import AdaptiveRateLimiter
+
+# Общий на процесс лимит скорости: все рассылки (всем и по группам) делят один бюджет.
+# Скорость подстраивается под ответы Telegram: растёт, пока нет flood-ошибок, и
+# снижается при TelegramRetryAfter.
+broadcast_limiter = AdaptiveRateLimiter(BROADCAST_RATE, min_rate=BROADCAST_MIN_RATE)
+
+# Сколько раз повторять отправку одному получателю после TelegramRetryAfter.
+FLOOD_RETRIES = 3
+
+# Сколько получателей задание забирает в работу за раз. Позиция сохраняется перед
+# отправкой каждой пачки, поэтому при аварийном перезапуске теряется не больше пачки.
+JOB_BATCH_SIZE = 100
+
+# Статусное сообщение обновляется не чаще раза в столько секунд: правки тоже расходуют
+# лимит запросов бота, а чаще администратору и не нужно.
+PROGRESS_EDIT_INTERVAL = 5.0
+
+AUDIENCE_ALL = {"kind": "all"}
+
+
+# Коды причин недоставки для журнала доставки и отчётов.
+FAILURE_REASONS = {
+    "blocked": "заблокировали бота",
+    "deactivated": "аккаунт удалён",
+    "chat_not_found": "чат не найден",
+    "flood": "flood control не снялся",
+    "bad_request": "Telegram отклонил запрос",
+    "error": "прочие ошибки",
+}
+
+
+class BroadcastResult(NamedTuple):
+    success: int
+    failed: int
+
+
+class Delivery(NamedTuple):
+    """Итог отправки одному получателю: error — код из FAILURE_REASONS или None.
+
+    message_ids — ID отправленных сообщений (несколько для альбома).
+    """
+
+    user_id: int
+    error: Optional[str] = None
+    message_ids: Tuple[int, ...] = ()
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class BroadcastProgress:
+    """Счётчики выполняющейся рассылки; отправители обновляют их по ходу работы."""
+
+    __slots__ = ("success", "failed")
+
+    def __init__(self):
+        self.success = 0
+        self.failed = 0
+
+    @property
+    def done(self) -> int:
+        return self.success + self.failed
+
+
+def group_audience(group_id: int) -> dict:
+    return {"kind": "group", "group_id": group_id}
+
+
+def expression_audience(expr: dict) -> dict:
+    """Аудитория по выражению над группами и историей наград (см. database.count_audience)."""
+    if expr.get("op") == "group":
+        # Одна группа без условий быстрее выбирается напрямую по индексу подписок.
+        return group_audience(expr["id"])
+    return {"kind": "expr", "expr": expr}
+
+
+def build_link_keyboard(text: Optional[str], url: Optional[str]) -> Optional[InlineKeyboardMarkup]:
+    if text and url:
+        return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=text, url=url)]])
+    return None
+
+
+async def dispatch_broadcast_to_user(
+    user_id: int,
+    broadcast_type: str,
+    payload: str,
+    caption: Optional[str],
+    markup: Optional[InlineKeyboardMarkup],
+) -> types.Message:
+    if broadcast_type == "text":
+        return await bot.send_message(user_id, payload, reply_markup=markup)
+    if broadcast_type == "photo":
+        return await bot.send_photo(user_id, payload, caption=caption, reply_markup=markup)
+    if broadcast_type == "video":
+        return await bot.send_video(user_id, payload, caption=caption, reply_markup=markup)
+    if broadcast_type == "document":
+        return await bot.send_document(user_id, payload, caption=caption, reply_markup=markup)
+    raise ValueError(f"Unsupported broadcast type: {broadcast_type}")
+
+
+async def copy_broadcast_source(
+    chat_id: int,
+    from_chat_id: int,
+    message_ids: List[int],
+    markup: Optional[InlineKeyboardMarkup],
+) -> Union[types.MessageId, List[types.MessageId]]:
+    """Копирует исходное сообщение администратора (или альбом) в чат получателя.
+
+    Запрос содержит только ссылку на исходное сообщение, а не его содержимое; форматирование,
+    любые типы медиа и альбомы сохраняются. К альбому кнопку прикрепить нельзя.
+    """
+    if len(message_ids) == 1:
+        return await bot.copy_message(chat_id, from_chat_id, message_ids[0], reply_markup=markup)
+    return await bot.copy_messages(chat_id, from_chat_id, message_ids)
+
+
+def _message_ids(sent: object) -> Tuple[int, ...]:
+    if isinstance(sent, list):
+        return tuple(item.message_id for item in sent)
+    message_id = getattr(sent, "message_id", None)
+    return (message_id,) if message_id is not None else ()
+
+
+async def _mark_inactive(user_id: int, status: str):
+    try:
+        await mark_user_inactive(user_id, status)
+    except Exception:
+        logging.exception("Не удалось пометить пользователя %s неактивным", user_id)
+
+
+async def _deliver(
+    user_id: int,
+    send: Callable[[int], Awaitable[object]],
+    limiter: AdaptiveRateLimiter,
+) -> Delivery:
+    """Отправляет сообщение одному получателю и возвращает итог.
+
+    TelegramRetryAfter снижает общую скорость и ставит на паузу всех отправителей,
+    после чего отправка этому же получателю повторяется. Заблокировавшие бота и
+    несуществующие чаты помечаются неактивными и в следующие рассылки не попадают.
+    """
+    for _ in range(FLOOD_RETRIES + 1):
+        await limiter.acquire()
+        try:
+            sent = await send(user_id)
+        except TelegramRetryAfter as exc:
+            limiter.on_flood(exc.retry_after)
+            logging.info(
+                "Flood control: пауза %s с, скорость снижена до %.1f сообщ./с",
+                exc.retry_after,
+                limiter.rate,
+            )
+            continue
+        except TelegramForbiddenError as exc:
+            # «bot was blocked by the user» или «user is deactivated»: больше не отправляем.
+            if "deactivated" in exc.message:
+                await _mark_inactive(user_id, USER_STATUS_DEACTIVATED)
+                return Delivery(user_id, "deactivated")
+            await _mark_inactive(user_id, USER_STATUS_BLOCKED)
+            return Delivery(user_id, "blocked")
+        except TelegramBadRequest as exc:
+            if "chat not found" in exc.message.lower():
+                await _mark_inactive(user_id, USER_STATUS_DEACTIVATED)
+                return Delivery(user_id, "chat_not_found")
+            logging.warning("Ошибка отправки пользователю %s: %s", user_id, exc)
+            return Delivery(user_id, "bad_request")
+        except Exception as exc:
+            logging.error("Неожиданная ошибка при рассылке пользователю %s: %s", user_id, exc)
+            return Delivery(user_id, "error")
+        limiter.on_success()
+        return Delivery(user_id, message_ids=_message_ids(sent))
+    logging.warning("Не удалось отправить сообщение пользователю %s: flood control не снимается", user_id)
+    return Delivery(user_id, "flood")
+
+
+async def run_broadcast(
+    recipient_batches: AsyncIterator[List[int]],
+    send: Callable[[int], Awaitable[object]],
+    *,
+    workers: int = BROADCAST_WORKERS,
+    limiter: AdaptiveRateLimiter = broadcast_limiter,
+    on_batch: Optional[Callable[[List[int], BroadcastResult], Awaitable[None]]] = None,
+    progress: Optional[BroadcastProgress] = None,
+    on_delivery: Optional[Callable[[Delivery], Awaitable[None]]] = None,
+) -> BroadcastResult:
+    """Рассылает сообщение пулом параллельных отправителей в пределах общего лимита скорости.
+
+    Получатели читаются из потока пачек по мере отправки; очередь между чтением и
+    отправителями ограничена, поэтому память не зависит от размера аудитории.
+    on_batch вызывается перед тем, как пачка уходит отправителям, с текущими итогами;
+    в progress счётчики обновляются после каждой отправки, а on_delivery получает
+    итог каждой отправки.
+    """
+    queue: "asyncio.Queue[Optional[int]]" = asyncio.Queue(maxsize=workers * 4)
+    if progress is None:
+        progress = BroadcastProgress()
+
+    async def produce():
+        try:
+            async for batch in recipient_batches:
+                if on_batch is not None:
+                    await on_batch(batch, BroadcastResult(progress.success, progress.failed))
+                for user_id in batch:
+                    await queue.put(user_id)
+        finally:
+            for _ in range(workers):
+                await queue.put(None)
+
+    async def work():
+        # Каждый отправитель — отдельная задача, поэтому приоритет действует только на
+        # запросы рассылки: ответы пользователям обгоняют их в общем лимите бота.
+        outbound_priority.set(PRIORITY_BULK)
+        while True:
+            user_id = await queue.get()
+            if user_id is None:
+                return
+            delivery = await _deliver(user_id, send, limiter)
+            if delivery.ok:
+                progress.success += 1
+            else:
+                progress.failed += 1
+            if on_delivery is not None:
+                # Сбой записи итога одного получателя не должен останавливать рассылку.
+                try:
+                    await on_delivery(delivery)
+                except Exception:
+                    logging.exception("Не удалось сохранить итог отправки пользователю %s", user_id)
+
+    tasks = [asyncio.create_task(produce())]
+    tasks.extend(asyncio.create_task(work()) for _ in range(workers))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # gather не отменяет остальные задачи, если одна упала: без этого отправители
+        # продолжили бы рассылку, которой уже никто не управляет.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return BroadcastResult(progress.success, progress.failed)
+
+
+# ── Сохраняемые задания ───────────────────────────────────────────────────
+#
+# Выполняющиеся задания регистрируются в _running_jobs. Пауза, отмена и остановка при
+# выключении бота кооперативные: задание перестаёт брать новые пачки получателей,
+# дожидается отправки уже взятых и сохраняет итог. Одновременно может идти несколько
+# заданий — все они делят общий broadcast_limiter.
+
+# Сколько ждать штатной остановки заданий при выключении бота, прежде чем прервать их.
+SHUTDOWN_TIMEOUT = 10.0
+
+JOB_CALLBACK_PREFIX = "admin:job:"
+
+
+class _JobControl:
+    """Управление выполняющимся заданием: stop просит остановиться между пачками."""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.stop = asyncio.Event()
+        # Каким статусом завершить остановленное задание: paused, cancelled или
+        # running (остановка при выключении — задание продолжится после перезапуска).
+        self.stop_status = "running"
+        # Цикл рассылки завершён и итог уже выбран: остановить или отменить задание поздно.
+        self.finishing = False
+
+    def request_stop(self, status: str) -> bool:
+        if self.finishing:
+            return False
+        if self.stop.is_set():
+            # Отмена важнее паузы: пока задание дорассылает пачку, паузу можно заменить отменой.
+            if status == "cancelled" and self.stop_status == "paused":
+                self.stop_status = status
+                return True
+            return False
+        self.stop_status = status
+        self.stop.set()
+        return True
+
+
+_running_jobs: Dict[int, _JobControl] = {}
+
+
+def build_job_controls(job_id: int, status: str) -> Optional[InlineKeyboardMarkup]:
+    """Кнопки управления рассылкой под статусным сообщением."""
+    cancel = InlineKeyboardButton(text="✖️ Отменить", callback_data=f"{JOB_CALLBACK_PREFIX}cancel:{job_id}")
+    if status == "running":
+        toggle = InlineKeyboardButton(text="⏸ Пауза", callback_data=f"{JOB_CALLBACK_PREFIX}pause:{job_id}")
+    elif status == "paused":
+        toggle = InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"{JOB_CALLBACK_PREFIX}resume:{job_id}")
+    elif status == "scheduled":
+        return InlineKeyboardMarkup(inline_keyboard=[[cancel]])
+    else:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[[toggle, cancel]])
+
+
+def _audience_batches(audience: dict, after: int) -> AsyncIterator[List[int]]:
+    if audience["kind"] == "all":
+        return iter_all_user_id_batches(after, JOB_BATCH_SIZE)
+    if audience["kind"] == "group":
+        return iter_group_user_id_batches(audience["group_id"], after, JOB_BATCH_SIZE)
+    if audience["kind"] == "expr":
+        return iter_audience_user_id_batches(audience["expr"], after, JOB_BATCH_SIZE)
+    raise ValueError(f"Unsupported audience: {audience}")
+
+
+async def _audience_size(audience: dict) -> int:
+    if audience["kind"] == "all":
+        return await get_active_user_count()
+    if audience["kind"] == "group":
+        return await get_group_subscriber_count(audience["group_id"], active_only=True)
+    if audience["kind"] == "expr":
+        return await count_audience(audience["expr"])
+    raise ValueError(f"Unsupported audience: {audience}")
+
+
+def _utcnow() -> datetime:
+    # В базе время хранится в UTC без указания пояса, как CURRENT_TIMESTAMP.
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def format_local_time(value: datetime) -> str:
+    """Показывает время из базы (UTC) в часовом поясе бота."""
+    return value.replace(tzinfo=timezone.utc).astimezone(BOT_TIMEZONE).strftime("%d.%m.%Y %H:%M")
+
+
+def _trickle_deadline(job: aiosqlite.Row) -> Optional[datetime]:
+    if not job["trickle_seconds"] or not job["scheduled_at"]:
+        return None
+    return parse_timestamp(job["scheduled_at"]) + timedelta(seconds=job["trickle_seconds"])
+
+
+def _trickle_rate(job: aiosqlite.Row) -> Optional[float]:
+    """Скорость, при которой оставшиеся получатели уложатся в окно растягивания.
+
+    Считается заново при каждом запуске задания (после паузы или перезапуска бота).
+    None — растягивать не нужно: окна нет, оно уже прошло или общий лимит и так ниже.
+    """
+    deadline = _trickle_deadline(job)
+    if deadline is None:
+        return None
+    seconds_left = (deadline - _utcnow()).total_seconds()
+    remaining = job["total"] - job["sent"] - job["failed"]
+    if seconds_left <= 0 or remaining <= 0:
+        return None
+    rate = remaining / seconds_left
+    return rate if rate < broadcast_limiter.max_rate else None
+
+
+async def _trickle_batches(
+    batches: AsyncIterator[List[int]],
+    rate: float,
+    stop: asyncio.Event,
+) -> AsyncIterator[List[int]]:
+    """Отдаёт получателей порциями примерно на секунду отправки, в среднем rate в секунду.
+
+    Темп задаётся здесь, до того как получатели взяты в работу: в очереди отправителей
+    остаётся не больше порции, поэтому пауза и выключение бота не ждут конца окна.
+    Ожидание прерывается остановкой задания.
+    """
+    chunk_size = max(1, int(rate))
+    next_at = time.monotonic()
+    async for batch in batches:
+        for start in range(0, len(batch), chunk_size):
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(stop.wait(), delay)
+                    return
+                except asyncio.TimeoutError:
+                    pass
+            chunk = batch[start:start + chunk_size]
+            next_at = max(next_at, time.monotonic()) + len(chunk) / rate
+            yield chunk
+
+
+async def _edit_status(job: aiosqlite.Row, text: str, markup: Optional[InlineKeyboardMarkup] = None) -> bool:
+    if not job["admin_chat_id"] or not job["status_message_id"]:
+        return False
+    try:
+        await bot.edit_message_text(
+            text,
+            chat_id=job["admin_chat_id"],
+            message_id=job["status_message_id"],
+            reply_markup=markup,
+        )
+        return True
+    except TelegramBadRequest as exc:
+        logging.warning("Не удалось обновить статус рассылки %s: %s", job["id"], exc)
+    except Exception as exc:
+        logging.warning("Ошибка при обновлении статуса рассылки %s: %s", job["id"], exc)
+    return False
+
+
+async def _report(job: aiosqlite.Row, text: str, markup: Optional[InlineKeyboardMarkup] = None):
+    """Обновляет статусное сообщение задания, а если не получилось — присылает новое."""
+    if not job["admin_chat_id"] or await _edit_status(job, text, markup):
+        return
+    try:
+        await bot.send_message(job["admin_chat_id"], text, reply_markup=markup)
+    except Exception as exc:
+        logging.error("Не удалось сообщить итог рассылки %s: %s", job["id"], exc)
+
+
+async def _show_controls(job: aiosqlite.Row, status: str):
+    if not job["admin_chat_id"] or not job["status_message_id"]:
+        return
+    try:
+        await bot.edit_message_reply_markup(
+            chat_id=job["admin_chat_id"],
+            message_id=job["status_message_id"],
+            reply_markup=build_job_controls(job["id"], status),
+        )
+    except TelegramBadRequest as exc:
+        logging.warning("Не удалось показать кнопки рассылки %s: %s", job["id"], exc)
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours} ч {minutes:02d} мин"
+    if minutes:
+        return f"{minutes} мин {seconds:02d} с"
+    return f"{seconds} с"
+
+
+def _format_totals(sent: int, failed: int, total: int) -> str:
+    return f"Успешно: {sent}\nНе доставлено: {failed}\nОсталось: {max(0, total - sent - failed)}"
+
+
+async def _report_progress(
+    job: aiosqlite.Row,
+    progress: BroadcastProgress,
+    heading: str,
+    controls: Optional[InlineKeyboardMarkup] = None,
+):
+    """Периодически показывает ход рассылки в статусном сообщении.
+
+    Правка делается не чаще PROGRESS_EDIT_INTERVAL и только если счётчики изменились.
+    Скорость — фактическая за последний интервал, оценка времени — по средней скорости
+    с момента запуска.
+    """
+    started_at = last_at = time.monotonic()
+    last_done = 0
+    while True:
+        await asyncio.sleep(PROGRESS_EDIT_INTERVAL)
+        done = progress.done
+        if done == last_done:
+            continue
+        now = time.monotonic()
+        current_rate = (done - last_done) / (now - last_at)
+        average_rate = done / (now - started_at)
+        last_done, last_at = done, now
+
+        sent = job["sent"] + progress.success
+        failed = job["failed"] + progress.failed
+        remaining = max(0, job["total"] - sent - failed)
+        lines = [
+            heading,
+            _format_totals(sent, failed, job["total"]),
+            f"Скорость: {current_rate:.1f} сообщ./с (лимит {broadcast_limiter.rate:.1f})",
+        ]
+        if broadcast_limiter.paused:
+            lines.append("Пауза по требованию Telegram (flood control).")
+        elif remaining:
+            lines.append(f"Осталось времени: ~{_format_duration(remaining / average_rate)}")
+        await _edit_status(job, "\n".join(lines), controls)
+
+
+async def _run_job(job: aiosqlite.Row, control: _JobControl):
+    job_id = job["id"]
+    content = json.loads(job["content"])
+    audience = json.loads(job["audience"])
+    markup = build_link_keyboard(content.get("button_text"), content.get("button_url"))
+    claimed = job["cursor"]
+    trickle_rate = _trickle_rate(job)
+
+    def send(user_id: int):
+        if content["type"] == "copy":
+            return copy_broadcast_source(user_id, content["from_chat_id"], content["message_ids"], markup)
+        return dispatch_broadcast_to_user(
+            user_id, content["type"], content["payload"], content.get("caption"), markup
+        )
+
+    async def batches() -> AsyncIterator[List[int]]:
+        # Остановка проверяется между пачками: взятые в работу получатели дорассылаются.
+        source = _audience_batches(audience, claimed)
+        if trickle_rate is not None:
+            source = _trickle_batches(source, trickle_rate, control.stop)
+        async for batch in source:
+            if control.stop.is_set():
+                return
+            yield batch
+
+    async def checkpoint(batch: List[int], progress: BroadcastResult):
+        nonlocal claimed
+        claimed = batch[-1]
+        await checkpoint_broadcast_job(
+            job_id,
+            claimed,
+            job["sent"] + progress.success,
+            job["failed"] + progress.failed,
+        )
+
+    heading = f"Рассылка {job['title']} идёт."
+    if trickle_rate is not None:
+        heading += f"\nРастянута до {format_local_time(_trickle_deadline(job))}."
+    progress = BroadcastProgress()
+    reporter = asyncio.create_task(_report_progress(job, progress, heading, build_job_controls(job_id, "running")))
+    try:
+        try:
+            result = await run_broadcast(
+                batches(),
+                send,
+                on_batch=checkpoint,
+                progress=progress,
+                on_delivery=lambda delivery: record_broadcast_delivery(
+                    job_id,
+                    delivery.user_id,
+                    "sent" if delivery.ok else "failed",
+                    delivery.error,
+                    delivery.message_ids,
+                ),
+            )
+        finally:
+            reporter.cancel()
+            control.finishing = True
+    except asyncio.CancelledError:
+        # Задание остаётся в статусе running и продолжится при следующем запуске.
+        raise
+    except Exception:
+        logging.exception("Рассылка %s прервана из-за ошибки", job_id)
+        job = await fetch_broadcast_job(job_id)
+        await finish_broadcast_job(job_id, job["sent"], job["failed"], status="failed")
+        await _report(job, f"Рассылка {job['title']} прервана из-за ошибки.\nУспешно: {job['sent']}")
+        return
+
+    sent = job["sent"] + result.success
+    failed = job["failed"] + result.failed
+    totals = _format_totals(sent, failed, job["total"])
+    # Читаем до первого await: после него request_stop уже ничего не меняет.
+    stop_status = control.stop_status if control.stop.is_set() else None
+    if stop_status == "cancelled":
+        await finish_broadcast_job(job_id, sent, failed, status="cancelled")
+        await _report(job, f"Рассылка {job['title']} отменена.\n{totals}")
+    elif stop_status is not None:
+        await checkpoint_broadcast_job(job_id, claimed, sent, failed)
+        if stop_status == "paused":
+            await set_broadcast_job_status(job_id, "paused")
+            await _report(
+                job,
+                f"Рассылка {job['title']} приостановлена.\n{totals}",
+                build_job_controls(job_id, "paused"),
+            )
+    else:
+        await finish_broadcast_job(job_id, sent, failed)
+        await _report(
+            job,
+            f"Рассылка {job['title']} завершена.\n"
+            f"Успешно: {sent}\n"
+            f"Не доставлено: {failed}\n"
+            f"Лимит скорости: {broadcast_limiter.rate:.1f} сообщ./с",
+        )
+
+
+def _spawn_job(job: aiosqlite.Row):
+    job_id = job["id"]
+    control = _JobControl()
+    control.task = asyncio.create_task(_run_job(job, control))
+    _running_jobs[job_id] = control
+
+    def forget(_):
+        if _running_jobs.get(job_id) is control:
+            del _running_jobs[job_id]
+
+    control.task.add_done_callback(forget)
+
+
+async def start_broadcast_job(
+    title: str,
+    content: dict,
+    audience: dict,
+    status_message: Optional[types.Message],
+    total: int,
+) -> int:
+    """Сохраняет задание рассылки и запускает его в фоне. Возвращает ID задания."""
+    job_id = await create_broadcast_job(
+        title=title,
+        content=content,
+        audience=audience,
+        admin_chat_id=status_message.chat.id if status_message else None,
+        status_message_id=status_message.message_id if status_message else None,
+        total=total,
+    )
+    job = await fetch_broadcast_job(job_id)
+    _spawn_job(job)
+    await _show_controls(job, "running")
+    return job_id
+
+
+async def pause_broadcast_job(job_id: int) -> bool:
+    """Просит выполняющуюся рассылку приостановиться после текущей пачки."""
+    control = _running_jobs.get(job_id)
+    return control is not None and control.request_stop("paused")
+
+
+async def resume_broadcast_job(job_id: int) -> bool:
+    """Продолжает приостановленную рассылку с сохранённой позиции.
+
+    Статус меняется условным UPDATE, и задание регистрируется сразу после него, без
+    промежуточных await: повторное нажатие «Продолжить» не запустит второй экземпляр.
+    """
+    if job_id in _running_jobs or job_id in _running_operations:
+        return False
+    job = await fetch_broadcast_job(job_id)
+    if job is None or job["status"] != "paused":
+        return False
+    if not await resume_paused_broadcast_job(job_id):
+        return False
+    # Позиция и счётчики приостановленного задания не меняются, строка job актуальна.
+    _spawn_job(job)
+    await _show_controls(job, "running")
+    return True
+
+
+async def cancel_broadcast_job(job_id: int) -> bool:
+    """Отменяет рассылку: выполняющаяся останавливается после текущей пачки."""
+    control = _running_jobs.get(job_id)
+    if control is not None:
+        return control.request_stop("cancelled")
+    job = await fetch_broadcast_job(job_id)
+    if job is not None and job["status"] == "scheduled":
+        if not await cancel_scheduled_broadcast_job(job_id):
+            return False
+        await _report(job, f"Запланированная рассылка {job['title']} отменена.")
+        return True
+    if job is None or job["status"] != "paused" or not await cancel_paused_broadcast_job(job_id):
+        return False
+    totals = _format_totals(job["sent"], job["failed"], job["total"])
+    await _report(job, f"Рассылка {job['title']} отменена.\n{totals}")
+    return True
+
+
+async def resume_broadcast_jobs():
+    """Продолжает рассылки, прерванные перезапуском процесса."""
+    for job in await fetch_broadcast_jobs("running"):
+        if job["id"] in _running_jobs:
+            continue
+        logging.info("Продолжаю рассылку %s с получателя после ID %s", job["id"], job["cursor"])
+        _spawn_job(job)
+
+
+async def stop_broadcast_jobs(timeout: float = SHUTDOWN_TIMEOUT):
+    """Останавливает выполняющиеся рассылки при выключении бота.
+
+    Задания дорассылают уже взятые пачки и сохраняют позицию; не успевшие за timeout
+    прерываются (их позиция тоже сохранена, теряется не больше пачки).
+    """
+    # Сначала планировщик, чтобы он не запустил новых заданий во время остановки.
+    tasks = []
+    if _scheduler_task is not None:
+        _scheduler_task.cancel()
+        tasks.append(_scheduler_task)
+    controls = list(_running_jobs.values())
+    for control in controls:
+        control.request_stop("running")
+    tasks.extend(control.task for control in controls)
+    # Удаление и правка отправленных рассылок не сохраняются: их просто прерываем.
+    for task in _running_operations.values():
+        task.cancel()
+    tasks.extend(_running_operations.values())
+    if not tasks:
+        return
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# ── Отложенные рассылки ──────────────────────────────────────────────────
+#
+# Запланированные задания хранятся в broadcast_jobs со статусом scheduled, поэтому
+# переживают перезапуск. Планировщик спит до ближайшего scheduled_at (или до нового
+# задания) и запускает наступившие; пропущенные, пока бот был выключен, запускаются
+# сразу после старта.
+
+# Дольше не спим, даже если ближайшее задание нескоро: страховка от перевода часов.
+SCHEDULER_MAX_SLEEP = 60.0
+
+_scheduler_task: Optional[asyncio.Task] = None
+_scheduler_wakeup = asyncio.Event()
+
+
+async def schedule_broadcast_job(
+    title: str,
+    content: dict,
+    audience: dict,
+    status_message: Optional[types.Message],
+    total: int,
+    run_at: datetime,
+    trickle_seconds: int = 0,
+) -> int:
+    """Сохраняет рассылку на время run_at (UTC). Возвращает ID задания.
+
+    С trickle_seconds рассылка растягивается на это окно после run_at; аудитория
+    пересчитывается в момент запуска.
+    """
+    job_id = await create_broadcast_job(
+        title=title,
+        content=content,
+        audience=audience,
+        admin_chat_id=status_message.chat.id if status_message else None,
+        status_message_id=status_message.message_id if status_message else None,
+        total=total,
+        scheduled_at=run_at,
+        trickle_seconds=trickle_seconds,
+    )
+    await _show_controls(await fetch_broadcast_job(job_id), "scheduled")
+    _scheduler_wakeup.set()
+    return job_id
+
+
+async def _start_scheduled_job(job: aiosqlite.Row):
+    total = await _audience_size(json.loads(job["audience"]))
+    if not await start_scheduled_broadcast_job(job["id"], total):
+        return
+    job = await fetch_broadcast_job(job["id"])
+    logging.info("Запускаю запланированную рассылку %s", job["id"])
+    _spawn_job(job)
+    await _edit_status(
+        job,
+        f"Рассылка {job['title']} началась.\n{_format_totals(0, 0, total)}",
+        build_job_controls(job["id"], "running"),
+    )
+
+
+async def _run_scheduler():
+    while True:
+        _scheduler_wakeup.clear()
+        try:
+            for job in await fetch_due_broadcast_jobs(_utcnow()):
+                await _start_scheduled_job(job)
+            next_at = await get_next_broadcast_schedule_time()
+        except Exception:
+            logging.exception("Ошибка планировщика рассылок")
+            next_at = None
+        delay = SCHEDULER_MAX_SLEEP
+        if next_at is not None:
+            delay = min(delay, max(0.0, (next_at - _utcnow()).total_seconds()))
+        try:
+            await asyncio.wait_for(_scheduler_wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_broadcast_scheduler():
+    """Запускает планировщик отложенных рассылок; останавливается в stop_broadcast_jobs()."""
+    global _scheduler_task
+    if _scheduler_task is None or _scheduler_task.done():
+        _scheduler_task = asyncio.create_task(_run_scheduler())
+
+
+# ── Удаление и правка отправленной рассылки ──────────────────────────────
+#
+# Работает по журналу доставки: для каждого получателя известен message_id. Запросы
+# идут через тот же движок и общий лимит скорости, что и сама рассылка.
+
+_running_operations: Dict[int, asyncio.Task] = {}
+
+
+async def _sent_message_batches(job_id: int, message_ids: Dict[int, List[int]]) -> AsyncIterator[List[int]]:
+    # Последние записи журнала могут ещё лежать в очереди отложенной записи.
+    await flush_pending_writes()
+    async for rows in iter_sent_broadcast_message_batches(job_id, batch_size=JOB_BATCH_SIZE):
+        for row in rows:
+            album = row["album_message_ids"]
+            message_ids[row["user_id"]] = json.loads(album) if album else [row["message_id"]]
+        yield [row["user_id"] for row in rows]
+
+
+async def _run_message_operation(
+    job: aiosqlite.Row,
+    status_message: Optional[types.Message],
+    total: int,
+    name: str,
+    action: Callable[[int, List[int]], Awaitable[object]],
+    on_success: Optional[Callable[[int], Awaitable[None]]] = None,
+):
+    message_ids: Dict[int, List[int]] = {}
+    status = {
+        "id": job["id"],
+        "title": job["title"],
+        "admin_chat_id": status_message.chat.id if status_message else None,
+        "status_message_id": status_message.message_id if status_message else None,
+        "total": total,
+        "sent": 0,
+        "failed": 0,
+    }
+
+    async def send(user_id: int):
+        return await action(user_id, message_ids.pop(user_id))
+
+    async def record(delivery: Delivery):
+        if delivery.ok and on_success is not None:
+            await on_success(delivery.user_id)
+
+    progress = BroadcastProgress()
+    reporter = asyncio.create_task(_report_progress(status, progress, f"{name} рассылки {job['title']} идёт."))
+    try:
+        try:
+            result = await run_broadcast(
+                _sent_message_batches(job["id"], message_ids),
+                send,
+                progress=progress,
+                on_delivery=record,
+            )
+        finally:
+            reporter.cancel()
+    except Exception:
+        logging.exception("%s рассылки %s прервано из-за ошибки", name, job["id"])
+        await _report(status, f"{name} рассылки {job['title']} прервано из-за ошибки.")
+        return
+    await _report(
+        status,
+        f"{name} рассылки {job['title']} завершено.\n"
+        f"Успешно: {result.success}\n"
+        f"Не удалось: {result.failed}",
+    )
+
+
+async def _start_message_operation(job_id: int, start: Callable[[aiosqlite.Row], Awaitable[None]]) -> bool:
+    if job_id in _running_jobs or job_id in _running_operations:
+        return False
+    job = await fetch_broadcast_job(job_id)
+    if job is None:
+        return False
+    task = asyncio.create_task(start(job))
+    _running_operations[job_id] = task
+    task.add_done_callback(lambda _: _running_operations.pop(job_id, None))
+    return True
+
+
+async def unsend_broadcast(job_id: int, status_message: Optional[types.Message], total: int) -> bool:
+    """Удаляет сообщения рассылки у всех получателей.
+
+    Возвращает False, если рассылка ещё идёт или с ней уже выполняется другая операция.
+    Telegram позволяет боту удалять свои сообщения в личных чатах только в течение 48 часов.
+    """
+
+    async def delete(user_id: int, message_ids: List[int]):
+        # Все сообщения альбома удаляются одним запросом.
+        return await bot.delete_messages(user_id, message_ids)
+
+    async def mark_deleted(user_id: int):
+        await set_broadcast_delivery_status(job_id, user_id, "deleted")
+
+    return await _start_message_operation(
+        job_id,
+        lambda job: _run_message_operation(job, status_message, total, "Удаление", delete, mark_deleted),
+    )
+
+
+async def edit_broadcast(job_id: int, new_text: str, status_message: Optional[types.Message], total: int) -> bool:
+    """Заменяет текст (или подпись к медиа) в уже отправленных сообщениях рассылки.
+
+    Возвращает False, если рассылка ещё идёт или с ней уже выполняется другая операция.
+    """
+
+    async def start(job: aiosqlite.Row):
+        content = json.loads(job["content"])
+        markup = build_link_keyboard(content.get("button_text"), content.get("button_url"))
+        if content["type"] == "text" or content.get("is_text"):
+            content["payload"] = new_text
+
+            async def edit(user_id: int, message_ids: List[int]):
+                return await bot.edit_message_text(
+                    new_text, chat_id=user_id, message_id=message_ids[0], reply_markup=markup
+                )
+
+        else:
+            content["caption"] = new_text
+
+            # Подпись альбома хранится в его первом сообщении.
+            async def edit(user_id: int, message_ids: List[int]):
+                return await bot.edit_message_caption(
+                    chat_id=user_id, message_id=message_ids[0], caption=new_text, reply_markup=markup
+                )
+
+        await update_broadcast_job_content(job_id, content)
+        await _run_message_operation(job, status_message, total, "Изменение", edit)
+
+    return await _start_message_operation(job_id, start)
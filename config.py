@@ -1,9 +1,12 @@
 import os
+from zoneinfo import ZoneInfo
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from dotenv import load_dotenv
 
+from outbound import OutboundRateLimiter, RequestRetryMiddleware
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -18,6 +21,31 @@ if admin_ids_raw:
 else:
     ADMIN_IDS = []
 
+# Broadcast settings: number of concurrent senders and the shared messages-per-second budget
+# (Telegram allows roughly 30 messages per second per bot)
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "28"))
+# Lower bound for the adaptive broadcast rate after Telegram flood-control responses
+BROADCAST_MIN_RATE = float(os.getenv("BROADCAST_MIN_RATE", "1"))
+# Limits for every message the bot sends: a global messages-per-second budget shared by
+# replies and broadcasts (keep BROADCAST_RATE below it so replies always have headroom)
+# and a per-chat limit with a small burst
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+# Retries of Bot API calls after flood control, server and network errors: attempts per
+# call (including the first one) and the longest flood-control wait worth sitting out
+API_MAX_ATTEMPTS = int(os.getenv("API_MAX_ATTEMPTS", "4"))
+API_MAX_RETRY_AFTER = float(os.getenv("API_MAX_RETRY_AFTER", "30"))
+# Time zone in which admins enter and see scheduled broadcast times
+BOT_TIMEZONE = ZoneInfo(os.getenv("BOT_TIMEZONE", "Europe/Moscow"))
+
 # Initialize bot and dispatcher for aiogram 3.x
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+# Retries wrap the rate limiter so that every repeated request is rate-limited again
+api_retries = RequestRetryMiddleware(max_attempts=API_MAX_ATTEMPTS, max_retry_after=API_MAX_RETRY_AFTER)
+bot.session.middleware(api_retries)
+bot.session.middleware(
+    OutboundRateLimiter(OUTBOUND_RATE, chat_rate=OUTBOUND_CHAT_RATE, chat_burst=OUTBOUND_CHAT_BURST)
+)
 dp = Dispatcher()
@@ -1,38 +1,587 @@
-import sqlite3
-from contextlib import contextmanager
-from typing import Iterable, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    FrozenSet,
+    Hashable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-# Для aiogram 3.x и современных практик используем контекстный менеджер для подключения
-# и создаем таблицы при импорте.
+import aiosqlite
+
+# Все операции с базой асинхронные: aiosqlite выполняет запросы в отдельном потоке,
+# поэтому обращения к SQLite не блокируют цикл событий aiogram.
+# Подключения долгоживущие: одно для записи (SQLite допускает единственного писателя)
+# и небольшой пул для чтения. Пул открывается, а схема мигрируется в init_db(), который
+# явно вызывается при запуске бота (см. bot.py); закрывается пул через close_db().
 
 DB_PATH = "users.db"
+READER_POOL_SIZE = 4
+USER_SNAPSHOT_CACHE_SIZE = 10_000
+
+# Отложенная запись: частые вставки копятся в памяти и сбрасываются одной транзакцией
+# раз в WRITE_BEHIND_INTERVAL секунд или при накоплении WRITE_BEHIND_MAX_ROWS строк.
+WRITE_BEHIND_INTERVAL = 0.05
+WRITE_BEHIND_MAX_ROWS = 500
+
+# Размер страницы при потоковой выборке получателей рассылки.
+RECIPIENT_BATCH_SIZE = 1000
+
+# Формат CURRENT_TIMESTAMP в SQLite (UTC).
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Статусы пользователя: рассылки получают только активные. Заблокировавший бота или
+# удалённый аккаунт помечается при ошибке отправки и снова становится активным по /start.
+USER_STATUS_ACTIVE = "active"
+USER_STATUS_BLOCKED = "blocked"
+USER_STATUS_DEACTIVATED = "deactivated"
 
+# Профили PRAGMA. WAL позволяет читателям работать параллельно с единственным писателем,
+# synchronous=NORMAL в режиме WAL делает fsync только при checkpoint.
+# cache_size в отрицательных значениях задаётся в КиБ, mmap_size — в байтах.
+PRAGMA_PROFILES = {
+    "default": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024 * 1024,
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    },
+    "low_memory": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "busy_timeout": 5000,
+        "temp_store": "DEFAULT",
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024 * 1024,
+        "busy_timeout": 10000,
+        "temp_store": "MEMORY",
+    },
+}
+PRAGMA_PROFILE = os.getenv("DB_PRAGMA_PROFILE", "default")
 
-@contextmanager
-def _get_connection():
-    """Возвращает подключение к SQLite с включёнными внешними ключами."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
+# journal_mode хранится в самом файле базы, поэтому выставляется один раз на писателе.
+_DATABASE_PRAGMAS = {"journal_mode"}
+
+_writer: Optional[aiosqlite.Connection] = None
+_writer_lock = asyncio.Lock()
+_readers: Optional["asyncio.Queue[aiosqlite.Connection]"] = None
+_pool_lock = asyncio.Lock()
+
+
+def _pragma_profile() -> dict:
+    """Возвращает настройки PRAGMA выбранного профиля."""
+    try:
+        return PRAGMA_PROFILES[PRAGMA_PROFILE]
+    except KeyError:
+        raise RuntimeError(f"Неизвестный профиль PRAGMA: {PRAGMA_PROFILE}") from None
+
+
+async def _open_connection(*, configure_database: bool = False) -> aiosqlite.Connection:
+    """Открывает подключение и один раз настраивает его PRAGMA."""
+    conn = await aiosqlite.connect(DB_PATH)
+    conn.row_factory = aiosqlite.Row
+    for name, value in _pragma_profile().items():
+        if name in _DATABASE_PRAGMAS and not configure_database:
+            continue
+        await conn.execute(f"PRAGMA {name} = {value}")
+    await conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+async def open_db():
+    """Открывает пул подключений, если он ещё не открыт."""
+    global _writer, _readers
+    async with _pool_lock:
+        if _writer is not None:
+            return
+        writer = await _open_connection(configure_database=True)
+        readers: "asyncio.Queue[aiosqlite.Connection]" = asyncio.Queue()
+        for _ in range(READER_POOL_SIZE):
+            readers.put_nowait(await _open_connection())
+        _writer, _readers = writer, readers
+
+
+async def close_db():
+    """Закрывает все подключения пула."""
+    global _writer, _readers
+    async with _pool_lock:
+        if _writer is None:
+            return
+        await _write_behind.stop()
+        async with _writer_lock:
+            await _writer.close()
+        while not _readers.empty():
+            await _readers.get_nowait().close()
+        _writer, _readers = None, None
+
+
+@asynccontextmanager
+async def _write_connection() -> AsyncIterator[aiosqlite.Connection]:
+    """Выдаёт единственное подключение для записи, сериализуя писателей."""
+    if _writer is None:
+        await open_db()
+    async with _writer_lock:
+        try:
+            yield _writer
+        except BaseException:
+            await _writer.rollback()
+            raise
+
+
+@asynccontextmanager
+async def _read_connection() -> AsyncIterator[aiosqlite.Connection]:
+    """Выдаёт свободное подключение для чтения из пула."""
+    if _readers is None:
+        await open_db()
+    readers = _readers
+    conn = await readers.get()
     try:
         yield conn
     finally:
-        conn.close()
+        readers.put_nowait(conn)
+
+
+class _WriteBehindQueue:
+    """Очередь отложенной записи с объединением строк в пакетные транзакции.
+
+    Операции разных видов сбрасываются в порядке объявления statements, поэтому
+    пользователи всегда вставляются раньше ссылающихся на них наград. Повторная
+    запись с тем же ключом заменяет ещё не сброшенную.
+    """
+
+    def __init__(self, statements: Dict[str, str], interval: float, max_rows: int):
+        self._statements = statements
+        self._interval = interval
+        self._max_rows = max_rows
+        self._pending: Dict[str, Dict[Hashable, Tuple]] = {kind: {} for kind in statements}
+        self._size = 0
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def pending(self, kind: str) -> Dict[Hashable, Tuple]:
+        return self._pending[kind]
+
+    def discard(self, kind: str, key: Hashable):
+        """Отменяет ещё не сброшенную запись."""
+        if self._pending[kind].pop(key, None) is not None:
+            self._size -= 1
+
+    async def put(self, kind: str, key: Hashable, params: Tuple):
+        bucket = self._pending[kind]
+        if key not in bucket:
+            self._size += 1
+        bucket[key] = params
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        if self._size >= self._max_rows:
+            self._full.set()
+        if self._size >= self._max_rows * 4:
+            # Писатель не успевает: притормаживаем производителей вместо роста очереди.
+            await self.flush()
+
+    async def flush(self):
+        if not self._size:
+            return
+        async with _write_connection() as conn:
+            batch = self._pending
+            self._pending = {kind: {} for kind in self._statements}
+            self._size = 0
+            try:
+                for kind, statement in self._statements.items():
+                    if batch[kind]:
+                        await conn.executemany(statement, list(batch[kind].values()))
+                await conn.commit()
+            except Exception:
+                logging.exception("Пакетная запись не удалась, повторяю построчно")
+                await conn.rollback()
+                await self._write_rows_individually(conn, batch)
+        for user_id, _ in batch.get("reward", {}):
+            _user_snapshots.invalidate(user_id)
+
+    async def _write_rows_individually(self, conn: aiosqlite.Connection, batch: Dict[str, Dict[Hashable, Tuple]]):
+        for kind, statement in self._statements.items():
+            for params in batch[kind].values():
+                try:
+                    await conn.execute(statement, params)
+                except Exception as exc:
+                    logging.error("Не удалось записать %s %s: %s", kind, params, exc)
+        await conn.commit()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self._interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logging.exception("Ошибка фонового сброса очереди записи")
+
+    async def stop(self):
+        """Останавливает фоновый сброс и записывает всё накопленное."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+_write_behind = _WriteBehindQueue(
+    {
+        # UPSERT, а не INSERT OR REPLACE: REPLACE удаляет строку, а вместе с ней каскадом
+        # награды и подписки пользователя, и сбивает счётчики на триггерах.
+        # Повторный /start возвращает пользователя, заблокировавшего бота, в число получателей.
+        "user": (
+            "INSERT INTO users (user_id, username) VALUES (?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET "
+            "username = excluded.username, "
+            "status = 'active', "
+            "status_changed_at = CASE WHEN users.status = 'active' "
+            "THEN users.status_changed_at ELSE CURRENT_TIMESTAMP END"
+        ),
+        "reward": "INSERT OR IGNORE INTO rewards_history (user_id, channel_id) VALUES (?, ?)",
+        "user_status": (
+            "UPDATE users SET status = ?1, status_changed_at = CURRENT_TIMESTAMP "
+            "WHERE user_id = ?2 AND status != ?1"
+        ),
+        "delivery": (
+            "INSERT OR REPLACE INTO broadcast_deliveries "
+            "(job_id, user_id, status, error, message_id, album_message_ids) "
+            "VALUES (?, ?, ?, ?, ?, ?)"
+        ),
+        "delivery_status": "UPDATE broadcast_deliveries SET status = ? WHERE job_id = ? AND user_id = ?",
+    },
+    interval=WRITE_BEHIND_INTERVAL,
+    max_rows=WRITE_BEHIND_MAX_ROWS,
+)
+
+
+async def flush_pending_writes():
+    """Немедленно записывает в базу всё, что накоплено в очереди отложенной записи."""
+    await _write_behind.flush()
+
+
+class _CatalogCache:
+    """Справочник в памяти процесса, перечитываемый при смене версии.
+
+    Каждая операция записи в таблицу вызывает invalidate(), увеличивая версию;
+    чтения обслуживаются из памяти, пока загруженная версия совпадает с текущей.
+    """
+
+    def __init__(self, query: str):
+        self._query = query
+        self._version = 0
+        self._loaded_version = -1
+        self._rows: Tuple[aiosqlite.Row, ...] = ()
+        self._by_id: Dict[int, aiosqlite.Row] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self):
+        self._version += 1
+
+    async def rows(self) -> Tuple[aiosqlite.Row, ...]:
+        if self._loaded_version != self._version:
+            async with self._lock:
+                if self._loaded_version != self._version:
+                    # Версию фиксируем до запроса: если запись случится во время чтения,
+                    # следующий вызов перечитает справочник ещё раз.
+                    version = self._version
+                    async with _read_connection() as conn:
+                        cursor = await conn.execute(self._query)
+                        rows = tuple(await cursor.fetchall())
+                    self._rows = rows
+                    self._by_id = {row["id"]: row for row in rows}
+                    self._loaded_version = version
+        return self._rows
+
+    async def get(self, row_id: int) -> Optional[aiosqlite.Row]:
+        await self.rows()
+        return self._by_id.get(row_id)
+
+
+_channel_catalog = _CatalogCache("SELECT * FROM channels ORDER BY id")
+_group_registry = _CatalogCache("SELECT * FROM subscription_groups ORDER BY id")
+
+
+class UserSnapshot(NamedTuple):
+    """Сводка по пользователю для построения меню."""
+
+    reward_channel_ids: FrozenSet[int]
+    group_ids: FrozenSet[int]
+
+    @property
+    def has_rewards(self) -> bool:
+        return bool(self.reward_channel_ids)
+
+
+class _UserSnapshotCache:
+    """LRU-кэш снимков пользователей, сбрасываемый при записи наград и подписок."""
+
+    def __init__(self, maxsize: int):
+        self._maxsize = maxsize
+        self._items: "OrderedDict[int, UserSnapshot]" = OrderedDict()
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, user_id: int) -> Optional[UserSnapshot]:
+        snapshot = self._items.get(user_id)
+        if snapshot is not None:
+            self._items.move_to_end(user_id)
+        return snapshot
+
+    def put(self, user_id: int, snapshot: UserSnapshot, generation: int):
+        # Снимок, прочитанный до записи, которая его сбросила, не сохраняем.
+        if generation != self._generation:
+            return
+        self._items[user_id] = snapshot
+        self._items.move_to_end(user_id)
+        while len(self._items) > self._maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._generation += 1
+        self._items.pop(user_id, None)
+
+    def set_group_ids(self, user_id: int, group_ids: FrozenSet[int]):
+        """Обновляет подписки в кэшированном снимке без повторного чтения из базы."""
+        self._generation += 1
+        snapshot = self._items.get(user_id)
+        if snapshot is not None:
+            self._items[user_id] = snapshot._replace(group_ids=group_ids)
+
+    def clear(self):
+        self._generation += 1
+        self._items.clear()
+
+
+_user_snapshots = _UserSnapshotCache(USER_SNAPSHOT_CACHE_SIZE)
+
+
+# ── Миграции схемы ─────────────────────────────────────────────────────────
+#
+# Версия схемы хранится в PRAGMA user_version. Каждая миграция — упорядоченный набор
+# идемпотентных шагов; каждый шаг выполняется в своей короткой транзакции, чтобы не
+# держать блокировку писателя дольше необходимого, а user_version повышается только
+# после успешного выполнения всех шагов миграции. Если процесс упадёт посередине,
+# миграция просто выполнится заново при следующем запуске.
+
+MIGRATION_BATCH_SIZE = 5000
+
+
+class _BatchedUpdate(NamedTuple):
+    """Шаг миграции, обрабатывающий большую таблицу пачками.
+
+    SQL должен принимать размер пачки параметром LIMIT ? и выбирать только ещё не
+    обработанные строки; шаг повторяется с фиксацией после каждой пачки, пока пачка
+    не окажется неполной. Между пачками писатель освобождается для обычных запросов.
+    """
 
+    sql: str
 
-def init_db():
-    """Инициализация базы данных и создание всех необходимых таблиц."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+
+MigrationStep = Union[str, _BatchedUpdate, Callable[[aiosqlite.Connection], Awaitable[None]]]
+
+
+class _Migration(NamedTuple):
+    description: str
+    steps: Tuple[MigrationStep, ...]
+
+
+async def _add_missing_channel_columns(conn: aiosqlite.Connection):
+    """Добавляет в channels колонки, которых нет в базах старых версий."""
+    cursor = await conn.execute("PRAGMA table_info(channels)")
+    columns = {row["name"] for row in await cursor.fetchall()}
+    if "button_title" not in columns:
+        await conn.execute("ALTER TABLE channels ADD COLUMN button_title TEXT")
+
+
+async def _create_stat_counters(conn: aiosqlite.Connection):
+    """Создаёт таблицы счётчиков, поддерживающие их триггеры и заполняет начальные значения.
+
+    Всё выполняется одной транзакцией, чтобы между подсчётом и созданием триггеров
+    не потерялась ни одна запись.
+    """
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stat_counters (
+            name  TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS channel_reward_counts (
+            channel_id INTEGER PRIMARY KEY,
+            delivered  INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (channel_id) REFERENCES channels (id) ON DELETE CASCADE
+        )
+        """
+    )
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS group_subscriber_counts (
+            group_id    INTEGER PRIMARY KEY,
+            subscribers INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (group_id) REFERENCES subscription_groups (id) ON DELETE CASCADE
+        )
+        """
+    )
+    triggers = {
+        "trg_users_count_insert": """
+            AFTER INSERT ON users BEGIN
+                UPDATE stat_counters SET value = value + 1 WHERE name = 'users';
+            END
+        """,
+        "trg_users_count_delete": """
+            AFTER DELETE ON users BEGIN
+                UPDATE stat_counters SET value = value - 1 WHERE name = 'users';
+            END
+        """,
+        "trg_rewards_count_insert": """
+            AFTER INSERT ON rewards_history BEGIN
+                INSERT INTO channel_reward_counts (channel_id, delivered) VALUES (NEW.channel_id, 1)
+                ON CONFLICT (channel_id) DO UPDATE SET delivered = delivered + 1;
+            END
+        """,
+        "trg_rewards_count_delete": """
+            AFTER DELETE ON rewards_history BEGIN
+                UPDATE channel_reward_counts SET delivered = delivered - 1 WHERE channel_id = OLD.channel_id;
+            END
+        """,
+        "trg_group_subscribers_insert": """
+            AFTER INSERT ON user_group_subscriptions BEGIN
+                INSERT INTO group_subscriber_counts (group_id, subscribers) VALUES (NEW.group_id, 1)
+                ON CONFLICT (group_id) DO UPDATE SET subscribers = subscribers + 1;
+            END
+        """,
+        "trg_group_subscribers_delete": """
+            AFTER DELETE ON user_group_subscriptions BEGIN
+                UPDATE group_subscriber_counts SET subscribers = subscribers - 1 WHERE group_id = OLD.group_id;
+            END
+        """,
+    }
+    for name, body in triggers.items():
+        await conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    await conn.execute(
+        "INSERT OR REPLACE INTO stat_counters (name, value) SELECT 'users', COUNT(*) FROM users"
+    )
+    await conn.execute("DELETE FROM channel_reward_counts")
+    await conn.execute(
+        """
+        INSERT INTO channel_reward_counts (channel_id, delivered)
+        SELECT channel_id, COUNT(*) FROM rewards_history GROUP BY channel_id
+        """
+    )
+    await conn.execute("DELETE FROM group_subscriber_counts")
+    await conn.execute(
+        """
+        INSERT INTO group_subscriber_counts (group_id, subscribers)
+        SELECT group_id, COUNT(*) FROM user_group_subscriptions GROUP BY group_id
+        """
+    )
+
+
+async def _add_user_status_columns(conn: aiosqlite.Connection):
+    cursor = await conn.execute("PRAGMA table_info(users)")
+    columns = {row["name"] for row in await cursor.fetchall()}
+    if "status" not in columns:
+        await conn.execute(f"ALTER TABLE users ADD COLUMN status TEXT NOT NULL DEFAULT '{USER_STATUS_ACTIVE}'")
+    if "status_changed_at" not in columns:
+        await conn.execute("ALTER TABLE users ADD COLUMN status_changed_at TIMESTAMP")
+
+
+async def _add_album_message_ids_column(conn: aiosqlite.Connection):
+    cursor = await conn.execute("PRAGMA table_info(broadcast_deliveries)")
+    columns = {row["name"] for row in await cursor.fetchall()}
+    if "album_message_ids" not in columns:
+        await conn.execute("ALTER TABLE broadcast_deliveries ADD COLUMN album_message_ids TEXT")
+
+
+async def _add_broadcast_schedule_columns(conn: aiosqlite.Connection):
+    cursor = await conn.execute("PRAGMA table_info(broadcast_jobs)")
+    columns = {row["name"] for row in await cursor.fetchall()}
+    if "scheduled_at" not in columns:
+        await conn.execute("ALTER TABLE broadcast_jobs ADD COLUMN scheduled_at TIMESTAMP")
+    if "trickle_seconds" not in columns:
+        await conn.execute("ALTER TABLE broadcast_jobs ADD COLUMN trickle_seconds INTEGER NOT NULL DEFAULT 0")
+
+
+async def _create_active_user_counter(conn: aiosqlite.Connection):
+    """Заводит счётчик активных пользователей и триггеры для него."""
+    triggers = {
+        "trg_active_users_insert": """
+            AFTER INSERT ON users WHEN NEW.status = 'active' BEGIN
+                UPDATE stat_counters SET value = value + 1 WHERE name = 'active_users';
+            END
+        """,
+        "trg_active_users_delete": """
+            AFTER DELETE ON users WHEN OLD.status = 'active' BEGIN
+                UPDATE stat_counters SET value = value - 1 WHERE name = 'active_users';
+            END
+        """,
+        "trg_active_users_status": """
+            AFTER UPDATE OF status ON users
+            WHEN (OLD.status = 'active') != (NEW.status = 'active') BEGIN
+                UPDATE stat_counters
+                SET value = value + CASE WHEN NEW.status = 'active' THEN 1 ELSE -1 END
+                WHERE name = 'active_users';
+            END
+        """,
+    }
+    for name, body in triggers.items():
+        await conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    await conn.execute(
+        """
+        INSERT OR REPLACE INTO stat_counters (name, value)
+        SELECT 'active_users', COUNT(*) FROM users WHERE status = 'active'
+        """
+    )
+
+
+MIGRATIONS: Tuple[_Migration, ...] = (
+    _Migration(
+        "Базовая схема",
+        (
             """
             CREATE TABLE IF NOT EXISTS users (
                 user_id   INTEGER PRIMARY KEY,
                 username  TEXT
             )
-            """
-        )
-        cursor.execute(
+            """,
             """
             CREATE TABLE IF NOT EXISTS channels (
                 id              INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -47,9 +596,7 @@ def init_db():
                 created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
-            """
-        )
-        cursor.execute(
+            """,
             """
             CREATE TABLE IF NOT EXISTS rewards_history (
                 id           INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -60,9 +607,7 @@ def init_db():
                 FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
                 FOREIGN KEY (channel_id) REFERENCES channels (id) ON DELETE CASCADE
             )
-            """
-        )
-        cursor.execute(
+            """,
             """
             CREATE TABLE IF NOT EXISTS subscription_groups (
                 id          INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -71,9 +616,7 @@ def init_db():
                 is_active   INTEGER NOT NULL DEFAULT 1,
                 created_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
-            """
-        )
-        cursor.execute(
+            """,
             """
             CREATE TABLE IF NOT EXISTS user_group_subscriptions (
                 user_id       INTEGER NOT NULL,
@@ -83,36 +626,167 @@ def init_db():
                 FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
                 FOREIGN KEY (group_id) REFERENCES subscription_groups(id) ON DELETE CASCADE
             )
+            """,
+            _add_missing_channel_columns,
+            _BatchedUpdate(
+                """
+                UPDATE channels SET button_title = title
+                WHERE id IN (
+                    SELECT id FROM channels
+                    WHERE (button_title IS NULL OR button_title = '') AND title != ''
+                    LIMIT ?
+                )
+                """
+            ),
+        ),
+    ),
+    _Migration(
+        "Индексы для статистики, наград и подписчиков групп",
+        (
+            # Каждый индекс строится отдельной транзакцией; в режиме WAL читатели
+            # во время построения не блокируются.
+            "CREATE INDEX IF NOT EXISTS idx_rewards_history_channel ON rewards_history (channel_id)",
+            "CREATE INDEX IF NOT EXISTS idx_rewards_history_user_delivered ON rewards_history (user_id, delivered_at)",
+            "CREATE INDEX IF NOT EXISTS idx_user_group_subscriptions_group ON user_group_subscriptions (group_id, user_id)",
+        ),
+    ),
+    _Migration(
+        "Счётчики для статистики администратора",
+        (_create_stat_counters,),
+    ),
+    _Migration(
+        "Сохраняемые задания рассылки",
+        (
             """
-        )
-        _ensure_channel_schema(cursor)
-        conn.commit()
+            CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                id                INTEGER PRIMARY KEY AUTOINCREMENT,
+                status            TEXT NOT NULL DEFAULT 'running',
+                title             TEXT NOT NULL DEFAULT '',
+                content           TEXT NOT NULL,
+                audience          TEXT NOT NULL,
+                admin_chat_id     INTEGER,
+                status_message_id INTEGER,
+                cursor            INTEGER NOT NULL DEFAULT 0,
+                total             INTEGER NOT NULL DEFAULT 0,
+                sent              INTEGER NOT NULL DEFAULT 0,
+                failed            INTEGER NOT NULL DEFAULT 0,
+                created_at        TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at        TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at       TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs (status)",
+        ),
+    ),
+    _Migration(
+        "Статус пользователей, заблокировавших бота",
+        (
+            _add_user_status_columns,
+            # Частичный индекс: постраничная выборка получателей идёт только по активным
+            # и не перебирает заблокировавших бота.
+            "CREATE INDEX IF NOT EXISTS idx_users_active ON users (user_id) WHERE status = 'active'",
+            _create_active_user_counter,
+        ),
+    ),
+    _Migration(
+        "Журнал доставки рассылок",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                job_id       INTEGER NOT NULL,
+                user_id      INTEGER NOT NULL,
+                status       TEXT NOT NULL,
+                error        TEXT,
+                message_id   INTEGER,
+                delivered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (job_id, user_id),
+                FOREIGN KEY (job_id) REFERENCES broadcast_jobs (id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+            """,
+        ),
+    ),
+    _Migration(
+        "ID всех сообщений альбома в журнале доставки",
+        (_add_album_message_ids_column,),
+    ),
+    _Migration(
+        "Отложенные рассылки",
+        (
+            _add_broadcast_schedule_columns,
+            # Планировщик ищет ближайшее задание только среди запланированных.
+            """
+            CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_scheduled
+            ON broadcast_jobs (scheduled_at) WHERE status = 'scheduled'
+            """,
+        ),
+    ),
+)
+SCHEMA_VERSION = len(MIGRATIONS)
 
 
-def _ensure_channel_schema(cursor: sqlite3.Cursor):
-    """Гарантирует наличие всех новых полей в таблице channels."""
-    cursor.execute("PRAGMA table_info(channels)")
-    columns = {row["name"] for row in cursor.fetchall()}
-    if "button_title" not in columns:
-        cursor.execute("ALTER TABLE channels ADD COLUMN button_title TEXT")
-        cursor.execute("UPDATE channels SET button_title = title WHERE button_title IS NULL OR button_title = ''")
+async def _run_migration_step(step: MigrationStep):
+    if isinstance(step, _BatchedUpdate):
+        while True:
+            async with _write_connection() as conn:
+                cursor = await conn.execute(step.sql, (MIGRATION_BATCH_SIZE,))
+                await conn.commit()
+            if cursor.rowcount < MIGRATION_BATCH_SIZE:
+                return
+            await asyncio.sleep(0)
+    async with _write_connection() as conn:
+        await conn.execute("BEGIN")
+        if isinstance(step, str):
+            await conn.execute(step)
+        else:
+            await step(conn)
+        await conn.commit()
 
 
-def add_user(user_id: int, username: str):
-    """Добавляет нового пользователя или обновляет username, если запись уже существует."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT OR REPLACE INTO users (user_id, username)
-            VALUES (?, ?)
-            """,
-            (user_id, username),
+async def get_schema_version() -> int:
+    """Возвращает текущую версию схемы базы (PRAGMA user_version)."""
+    async with _read_connection() as conn:
+        cursor = await conn.execute("PRAGMA user_version")
+        (version,) = await cursor.fetchone()
+        return version
+
+
+async def migrate():
+    """Применяет недостающие миграции. Если схема актуальна, ничего не делает."""
+    version = await get_schema_version()
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Версия схемы базы ({version}) новее, чем поддерживает код ({SCHEMA_VERSION})."
         )
-        conn.commit()
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logging.info("Миграция базы %s: %s", number, migration.description)
+        for step in migration.steps:
+            await _run_migration_step(step)
+        async with _write_connection() as conn:
+            await conn.execute(f"PRAGMA user_version = {number}")
+            await conn.commit()
+
+
+async def init_db():
+    """Открывает пул подключений и приводит схему базы к актуальной версии."""
+    await open_db()
+    await migrate()
+
+
+async def add_user(user_id: int, username: str):
+    """Добавляет нового пользователя или обновляет username (через очередь отложенной записи).
+
+    Пользователь, ранее заблокировавший бота, снова становится активным.
+    """
+    _write_behind.discard("user_status", user_id)
+    await _write_behind.put("user", user_id, (user_id, username))
+
 
+async def mark_user_inactive(user_id: int, status: str):
+    """Отмечает, что пользователь недоступен для рассылок (через очередь отложенной записи)."""
+    await _write_behind.put("user_status", user_id, (status, user_id))
 
-def add_channel(
+
+async def add_channel(
     title: str,
     button_title: str,
     chat_identifier: str,
@@ -122,9 +796,8 @@ def add_channel(
     magnet_caption: Optional[str],
 ) -> int:
     """Создаёт новый канал и возвращает его идентификатор."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+    async with _write_connection() as conn:
+        cursor = await conn.execute(
             """
             INSERT INTO channels (
                 title,
@@ -139,40 +812,32 @@ def add_channel(
             """,
             (title, button_title, chat_identifier, invite_link, magnet_type, magnet_payload, magnet_caption),
         )
-        conn.commit()
-        return cursor.lastrowid
+        await conn.commit()
+    _channel_catalog.invalidate()
+    return cursor.lastrowid
 
 
-def fetch_channels(active_only: bool = True) -> List[sqlite3.Row]:
-    """Возвращает список каналов. По умолчанию только активные."""
-    query = "SELECT * FROM channels"
-    params: Tuple = ()
+async def fetch_channels(active_only: bool = True) -> List[aiosqlite.Row]:
+    """Возвращает список каналов из кэша. По умолчанию только активные."""
+    channels = await _channel_catalog.rows()
     if active_only:
-        query += " WHERE is_active = 1"
-    query += " ORDER BY id"
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        return cursor.fetchall()
+        return [channel for channel in channels if channel["is_active"]]
+    return list(channels)
 
 
-def fetch_channel(channel_id: int) -> Optional[sqlite3.Row]:
-    """Возвращает один канал по идентификатору."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM channels WHERE id = ?", (channel_id,))
-        return cursor.fetchone()
+async def fetch_channel(channel_id: int) -> Optional[aiosqlite.Row]:
+    """Возвращает один канал по идентификатору из кэша."""
+    return await _channel_catalog.get(channel_id)
 
 
-def update_channel(channel_id: int, **fields) -> bool:
+async def update_channel(channel_id: int, **fields) -> bool:
     """Обновляет произвольные поля канала."""
     if not fields:
         return False
     assignments = ", ".join(f"{name} = ?" for name in fields)
     params: Tuple = tuple(fields.values()) + (channel_id,)
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+    async with _write_connection() as conn:
+        cursor = await conn.execute(
             f"""
             UPDATE channels
             SET {assignments},
@@ -181,80 +846,111 @@ def update_channel(channel_id: int, **fields) -> bool:
             """,
             params,
         )
-        conn.commit()
-        return cursor.rowcount > 0
+        await conn.commit()
+    _channel_catalog.invalidate()
+    return cursor.rowcount > 0
 
 
-def set_channel_active(channel_id: int, is_active: bool) -> bool:
+async def set_channel_active(channel_id: int, is_active: bool) -> bool:
     """Изменяет статус активности канала."""
-    return update_channel(channel_id, is_active=1 if is_active else 0)
+    return await update_channel(channel_id, is_active=1 if is_active else 0)
 
 
-def delete_channel(channel_id: int) -> bool:
+async def delete_channel(channel_id: int) -> bool:
     """Полностью удаляет канал."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM channels WHERE id = ?", (channel_id,))
-        conn.commit()
-        return cursor.rowcount > 0
-
-
-def record_reward_delivery(user_id: int, channel_id: int):
-    """Записывает факт выдачи литмагнита пользователю."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT OR IGNORE INTO rewards_history (user_id, channel_id)
-            VALUES (?, ?)
-            """,
-            (user_id, channel_id),
-        )
-        conn.commit()
+    async with _write_connection() as conn:
+        cursor = await conn.execute("DELETE FROM channels WHERE id = ?", (channel_id,))
+        await conn.commit()
+    _channel_catalog.invalidate()
+    _user_snapshots.clear()
+    return cursor.rowcount > 0
 
 
-def get_user_count() -> int:
-    """Возвращает общее количество пользователей."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM users")
-        (count,) = cursor.fetchone()
-        return count
+async def record_reward_delivery(user_id: int, channel_id: int):
+    """Записывает факт выдачи литмагнита пользователю (через очередь отложенной записи)."""
+    await _write_behind.put("reward", (user_id, channel_id), (user_id, channel_id))
+    _user_snapshots.invalidate(user_id)
+
+
+async def _get_counter(name: str) -> int:
+    async with _read_connection() as conn:
+        cursor = await conn.execute("SELECT value FROM stat_counters WHERE name = ?", (name,))
+        row = await cursor.fetchone()
+        return row["value"] if row else 0
 
 
-def get_reward_stats() -> List[sqlite3.Row]:
+async def get_user_count() -> int:
+    """Возвращает общее количество пользователей (из счётчика, поддерживаемого триггерами)."""
+    return await _get_counter("users")
+
+
+async def get_active_user_count() -> int:
+    """Возвращает количество пользователей, которым можно отправлять рассылки."""
+    return await _get_counter("active_users")
+
+
+async def get_reward_stats() -> List[aiosqlite.Row]:
     """Возвращает статистику выдачи литмагнитов по каналам."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+    async with _read_connection() as conn:
+        cursor = await conn.execute(
             """
             SELECT
                 c.id,
                 c.title,
-                COUNT(r.id) AS delivered
+                COALESCE(rc.delivered, 0) AS delivered
             FROM channels AS c
-            LEFT JOIN rewards_history AS r ON r.channel_id = c.id
-            GROUP BY c.id, c.title
+            LEFT JOIN channel_reward_counts AS rc ON rc.channel_id = c.id
             ORDER BY c.id
             """
         )
-        return cursor.fetchall()
+        return await cursor.fetchall()
+
+
+async def _iter_row_batches(
+    query: str,
+    params: Tuple,
+    after: int,
+    batch_size: int,
+) -> AsyncIterator[List[aiosqlite.Row]]:
+    """Постранично выбирает строки по ключу (WHERE id > ? ORDER BY id LIMIT ?).
+
+    Ключ должен быть первой колонкой выборки. Подключение берётся из пула только на
+    время одной страницы, поэтому долгая рассылка не занимает читателя между страницами.
+    """
+    while True:
+        async with _read_connection() as conn:
+            cursor = await conn.execute(query, params + (after, batch_size))
+            batch = await cursor.fetchall()
+        if not batch:
+            return
+        yield batch
+        if len(batch) < batch_size:
+            return
+        after = batch[-1][0]
+
+
+async def _iter_id_batches(query: str, params: Tuple, after: int, batch_size: int) -> AsyncIterator[List[int]]:
+    """Как _iter_row_batches, но возвращает только идентификаторы."""
+    async for batch in _iter_row_batches(query, params, after, batch_size):
+        yield [row[0] for row in batch]
 
 
-def get_all_user_ids() -> Iterable[int]:
-    """Возвращает идентификаторы всех пользователей для рассылок."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id FROM users")
-        rows = cursor.fetchall()
-    return [row["user_id"] for row in rows]
+def iter_all_user_id_batches(after: int = 0, batch_size: int = RECIPIENT_BATCH_SIZE) -> AsyncIterator[List[int]]:
+    """Потоково возвращает ID активных пользователей пачками по возрастанию ID."""
+    return _iter_id_batches(
+        "SELECT user_id FROM users WHERE status = 'active' AND user_id > ? ORDER BY user_id LIMIT ?",
+        (),
+        after,
+        batch_size,
+    )
 
 
-def get_user_reward_channels(user_id: int) -> List[sqlite3.Row]:
+async def get_user_reward_channels(user_id: int) -> List[aiosqlite.Row]:
     """Возвращает каналы, из которых пользователь уже получил материалы."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+    if any(key[0] == user_id for key in _write_behind.pending("reward")):
+        await _write_behind.flush()
+    async with _read_connection() as conn:
+        cursor = await conn.execute(
             """
             SELECT c.*
             FROM channels AS c
@@ -264,129 +960,563 @@ def get_user_reward_channels(user_id: int) -> List[sqlite3.Row]:
             """,
             (user_id,),
         )
-        return cursor.fetchall()
+        return await cursor.fetchall()
 
 
-def add_subscription_group(name: str, description: str) -> int:
+async def add_subscription_group(name: str, description: str) -> int:
     """Создаёт новую группу подписчиков и возвращает её ID."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+    async with _write_connection() as conn:
+        cursor = await conn.execute(
             "INSERT INTO subscription_groups (name, description) VALUES (?, ?)",
             (name, description),
         )
-        conn.commit()
-        return cursor.lastrowid
+        await conn.commit()
+    _group_registry.invalidate()
+    return cursor.lastrowid
 
 
-def fetch_subscription_groups(active_only: bool = True) -> List[sqlite3.Row]:
-    """Возвращает список групп подписчиков."""
-    query = "SELECT * FROM subscription_groups"
+async def fetch_subscription_groups(active_only: bool = True) -> List[aiosqlite.Row]:
+    """Возвращает список групп подписчиков из кэша."""
+    groups = await _group_registry.rows()
     if active_only:
-        query += " WHERE is_active = 1"
-    query += " ORDER BY id"
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(query)
-        return cursor.fetchall()
+        return [group for group in groups if group["is_active"]]
+    return list(groups)
 
 
-def fetch_subscription_group(group_id: int) -> Optional[sqlite3.Row]:
-    """Возвращает одну группу по ID."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM subscription_groups WHERE id = ?", (group_id,))
-        return cursor.fetchone()
+async def fetch_subscription_group(group_id: int) -> Optional[aiosqlite.Row]:
+    """Возвращает одну группу по ID из кэша."""
+    return await _group_registry.get(group_id)
 
 
-def update_subscription_group(group_id: int, **fields) -> bool:
+async def update_subscription_group(group_id: int, **fields) -> bool:
     """Обновляет произвольные поля группы."""
     if not fields:
         return False
     assignments = ", ".join(f"{name} = ?" for name in fields)
     params: Tuple = tuple(fields.values()) + (group_id,)
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(f"UPDATE subscription_groups SET {assignments} WHERE id = ?", params)
-        conn.commit()
-        return cursor.rowcount > 0
+    async with _write_connection() as conn:
+        cursor = await conn.execute(f"UPDATE subscription_groups SET {assignments} WHERE id = ?", params)
+        await conn.commit()
+    _group_registry.invalidate()
+    return cursor.rowcount > 0
 
 
-def delete_subscription_group(group_id: int) -> bool:
+async def delete_subscription_group(group_id: int) -> bool:
     """Полностью удаляет группу вместе со всеми подписками (CASCADE)."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM subscription_groups WHERE id = ?", (group_id,))
-        conn.commit()
-        return cursor.rowcount > 0
-
-
-def toggle_user_group(user_id: int, group_id: int) -> bool:
-    """Переключает подписку пользователя на группу.
-    Возвращает True, если теперь подписан; False, если отписан."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT 1 FROM user_group_subscriptions WHERE user_id = ? AND group_id = ?",
+    async with _write_connection() as conn:
+        cursor = await conn.execute("DELETE FROM subscription_groups WHERE id = ?", (group_id,))
+        await conn.commit()
+    _group_registry.invalidate()
+    _user_snapshots.clear()
+    return cursor.rowcount > 0
+
+
+async def toggle_user_group(user_id: int, group_id: int) -> Tuple[bool, FrozenSet[int]]:
+    """Атомарно переключает подписку пользователя на группу.
+
+    Возвращает пару (подписан ли теперь, актуальный набор ID групп пользователя), чтобы
+    обработчик мог перерисовать клавиатуру без дополнительных запросов.
+    """
+    if user_id in _write_behind.pending("user"):
+        # Подписка ссылается на users, поэтому сначала сбрасываем отложенную вставку.
+        await _write_behind.flush()
+    async with _write_connection() as conn:
+        # Одна транзакция на единственном писателе: параллельные нажатия не гоняются.
+        await conn.execute("BEGIN")
+        cursor = await conn.execute(
+            "DELETE FROM user_group_subscriptions WHERE user_id = ? AND group_id = ?",
             (user_id, group_id),
         )
-        already = cursor.fetchone() is not None
-        if already:
-            cursor.execute(
-                "DELETE FROM user_group_subscriptions WHERE user_id = ? AND group_id = ?",
-                (user_id, group_id),
-            )
-        else:
-            cursor.execute(
+        subscribed = cursor.rowcount == 0
+        if subscribed:
+            await conn.execute(
                 "INSERT INTO user_group_subscriptions (user_id, group_id) VALUES (?, ?)",
                 (user_id, group_id),
             )
-        conn.commit()
-        return not already
-
-
-def get_user_group_ids(user_id: int) -> List[int]:
-    """Возвращает ID групп, на которые подписан пользователь."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+        cursor = await conn.execute(
             "SELECT group_id FROM user_group_subscriptions WHERE user_id = ?",
             (user_id,),
         )
-        return [row["group_id"] for row in cursor.fetchall()]
+        group_ids = frozenset(row["group_id"] for row in await cursor.fetchall())
+        await conn.commit()
+    _user_snapshots.set_group_ids(user_id, group_ids)
+    return subscribed, group_ids
+
+
+async def get_user_snapshot(user_id: int) -> UserSnapshot:
+    """Возвращает полученные награды и подписки пользователя одним запросом (с LRU-кэшем)."""
+    snapshot = _user_snapshots.get(user_id)
+    if snapshot is not None:
+        return snapshot
+    generation = _user_snapshots.generation
+    async with _read_connection() as conn:
+        cursor = await conn.execute(
+            """
+            SELECT 'reward' AS kind, channel_id AS ref_id FROM rewards_history WHERE user_id = ?
+            UNION ALL
+            SELECT 'group' AS kind, group_id AS ref_id FROM user_group_subscriptions WHERE user_id = ?
+            """,
+            (user_id, user_id),
+        )
+        rows = await cursor.fetchall()
+    # Награды, ещё не сброшенные из очереди отложенной записи, тоже учитываем.
+    pending_rewards = {
+        channel_id for pending_user_id, channel_id in _write_behind.pending("reward") if pending_user_id == user_id
+    }
+    snapshot = UserSnapshot(
+        reward_channel_ids=frozenset(row["ref_id"] for row in rows if row["kind"] == "reward") | pending_rewards,
+        group_ids=frozenset(row["ref_id"] for row in rows if row["kind"] == "group"),
+    )
+    _user_snapshots.put(user_id, snapshot, generation)
+    return snapshot
+
+
+def iter_group_user_id_batches(
+    group_id: int,
+    after: int = 0,
+    batch_size: int = RECIPIENT_BATCH_SIZE,
+) -> AsyncIterator[List[int]]:
+    """Потоково возвращает ID активных подписчиков группы пачками по возрастанию ID."""
+    return _iter_id_batches(
+        """
+        SELECT s.user_id
+        FROM user_group_subscriptions AS s
+        INNER JOIN users AS u ON u.user_id = s.user_id
+        WHERE s.group_id = ? AND u.status = 'active' AND s.user_id > ?
+        ORDER BY s.user_id
+        LIMIT ?
+        """,
+        (group_id,),
+        after,
+        batch_size,
+    )
+
+
+# ── Выражения аудитории ──────────────────────────────────────────────────
+#
+# Аудитория рассылки задаётся деревом в JSON:
+#   {"op": "all"}                          — все пользователи;
+#   {"op": "group", "id": 3}               — подписчики группы;
+#   {"op": "reward", "id": 5}              — получившие литмагнит канала;
+#   {"op": "union" | "intersect", "args": [...]};
+#   {"op": "except", "args": [a, b]}       — a, кроме b.
+# Дерево компилируется в одно условие над users: каждый лист — проверка EXISTS по
+# индексу, операции — OR/AND/AND NOT. Выборка идёт одним проходом по активным
+# пользователям в порядке user_id, поэтому получатель, попавший в несколько групп,
+# встречается один раз, а постраничная выборка по ключу работает как обычно.
+
+_AUDIENCE_LEAVES = {
+    "group": "EXISTS (SELECT 1 FROM user_group_subscriptions WHERE user_id = u.user_id AND group_id = ?)",
+    "reward": "EXISTS (SELECT 1 FROM rewards_history WHERE user_id = u.user_id AND channel_id = ?)",
+}
+
+
+def _audience_condition(expr: dict) -> Tuple[str, List[int]]:
+    op = expr.get("op")
+    if op == "all":
+        return "1", []
+    if op in _AUDIENCE_LEAVES:
+        return _AUDIENCE_LEAVES[op], [int(expr["id"])]
+    args = expr.get("args") or []
+    if op in ("union", "intersect") and args:
+        parts = [_audience_condition(arg) for arg in args]
+        joiner = " OR " if op == "union" else " AND "
+        return (
+            "(" + joiner.join(sql for sql, _ in parts) + ")",
+            [param for _, params in parts for param in params],
+        )
+    if op == "except" and len(args) == 2:
+        (base_sql, base_params), (excluded_sql, excluded_params) = map(_audience_condition, args)
+        return f"({base_sql} AND NOT {excluded_sql})", base_params + excluded_params
+    raise ValueError(f"Unsupported audience expression: {expr}")
+
+
+def iter_audience_user_id_batches(
+    expr: dict,
+    after: int = 0,
+    batch_size: int = RECIPIENT_BATCH_SIZE,
+) -> AsyncIterator[List[int]]:
+    """Потоково возвращает ID активных пользователей, подходящих под выражение аудитории."""
+    condition, params = _audience_condition(expr)
+    return _iter_id_batches(
+        f"""
+        SELECT u.user_id FROM users AS u
+        WHERE u.status = 'active' AND {condition} AND u.user_id > ?
+        ORDER BY u.user_id
+        LIMIT ?
+        """,
+        tuple(params),
+        after,
+        batch_size,
+    )
 
 
-def get_group_user_ids(group_id: int) -> List[int]:
-    """Возвращает ID пользователей, подписанных на группу."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT user_id FROM user_group_subscriptions WHERE group_id = ?",
+async def count_audience(expr: dict) -> int:
+    """Возвращает количество активных пользователей, подходящих под выражение аудитории."""
+    condition, params = _audience_condition(expr)
+    async with _read_connection() as conn:
+        cursor = await conn.execute(
+            f"SELECT COUNT(*) FROM users AS u WHERE u.status = 'active' AND {condition}",
+            params,
+        )
+        (count,) = await cursor.fetchone()
+        return count
+
+
+async def get_group_subscriber_count(group_id: int, active_only: bool = False) -> int:
+    """Возвращает количество подписчиков группы.
+
+    С active_only=True считаются только активные пользователи; такой подсчёт идёт
+    по индексу подписок, а не по счётчику, поэтому дороже.
+    """
+    async with _read_connection() as conn:
+        if active_only:
+            cursor = await conn.execute(
+                """
+                SELECT COUNT(*)
+                FROM user_group_subscriptions AS s
+                INNER JOIN users AS u ON u.user_id = s.user_id
+                WHERE s.group_id = ? AND u.status = 'active'
+                """,
+                (group_id,),
+            )
+            (count,) = await cursor.fetchone()
+            return count
+        cursor = await conn.execute(
+            "SELECT subscribers FROM group_subscriber_counts WHERE group_id = ?",
             (group_id,),
         )
-        return [row["user_id"] for row in cursor.fetchall()]
+        row = await cursor.fetchone()
+        return row["subscribers"] if row else 0
 
 
-def get_group_stats() -> List[sqlite3.Row]:
+async def get_group_stats() -> List[aiosqlite.Row]:
     """Возвращает статистику подписчиков по группам."""
-    with _get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+    async with _read_connection() as conn:
+        cursor = await conn.execute(
             """
             SELECT
                 g.id,
                 g.name,
                 g.description,
                 g.is_active,
-                COUNT(s.user_id) AS subscribers
+                COALESCE(gc.subscribers, 0) AS subscribers
             FROM subscription_groups AS g
-            LEFT JOIN user_group_subscriptions AS s ON s.group_id = g.id
-            GROUP BY g.id
+            LEFT JOIN group_subscriber_counts AS gc ON gc.group_id = g.id
             ORDER BY g.id
             """
         )
-        return cursor.fetchall()
+        return await cursor.fetchall()
+
+
+# ── Задания рассылки ──────────────────────────────────────────────────────
+#
+# Содержимое и аудитория хранятся в JSON. cursor — наибольший user_id, до которого
+# включительно получатели уже взяты в работу: он сохраняется до отправки пачки, поэтому
+# после перезапуска рассылка продолжится со следующего получателя и никому не уйдёт
+# повторно (не более одной доставки на получателя).
+#
+# Статусы: scheduled — ждёт scheduled_at, running — выполняется (или будет продолжена
+# после перезапуска), paused — приостановлена администратором, finished/cancelled/failed —
+# завершена. scheduled_at хранится в UTC в формате CURRENT_TIMESTAMP; trickle_seconds —
+# окно, на которое рассылка растягивается после scheduled_at (0 — без растягивания).
+
+
+async def create_broadcast_job(
+    title: str,
+    content: dict,
+    audience: dict,
+    admin_chat_id: Optional[int],
+    status_message_id: Optional[int],
+    total: int,
+    scheduled_at: Optional[datetime] = None,
+    trickle_seconds: int = 0,
+) -> int:
+    """Сохраняет новое задание рассылки и возвращает его ID.
+
+    С scheduled_at (UTC) задание создаётся в статусе scheduled, иначе — running.
+    """
+    async with _write_connection() as conn:
+        cursor = await conn.execute(
+            """
+            INSERT INTO broadcast_jobs (
+                title, content, audience, admin_chat_id, status_message_id, total,
+                status, scheduled_at, trickle_seconds
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                title,
+                json.dumps(content, ensure_ascii=False),
+                json.dumps(audience),
+                admin_chat_id,
+                status_message_id,
+                total,
+                "scheduled" if scheduled_at else "running",
+                _format_timestamp(scheduled_at) if scheduled_at else None,
+                trickle_seconds,
+            ),
+        )
+        await conn.commit()
+        return cursor.lastrowid
+
+
+async def fetch_broadcast_job(job_id: int) -> Optional[aiosqlite.Row]:
+    """Возвращает задание рассылки по ID."""
+    async with _read_connection() as conn:
+        cursor = await conn.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,))
+        return await cursor.fetchone()
+
+
+async def fetch_broadcast_jobs(status: str) -> List[aiosqlite.Row]:
+    """Возвращает задания рассылки с указанным статусом."""
+    async with _read_connection() as conn:
+        cursor = await conn.execute(
+            "SELECT * FROM broadcast_jobs WHERE status = ? ORDER BY id",
+            (status,),
+        )
+        return await cursor.fetchall()
+
+
+async def checkpoint_broadcast_job(job_id: int, cursor_value: int, sent: int, failed: int):
+    """Сохраняет позицию и счётчики выполняющейся рассылки."""
+    async with _write_connection() as conn:
+        await conn.execute(
+            """
+            UPDATE broadcast_jobs
+            SET cursor = ?, sent = ?, failed = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            (cursor_value, sent, failed, job_id),
+        )
+        await conn.commit()
+
+
+async def update_broadcast_job_content(job_id: int, content: dict):
+    """Заменяет сохранённое содержимое рассылки (после правки уже отправленных сообщений)."""
+    async with _write_connection() as conn:
+        await conn.execute(
+            "UPDATE broadcast_jobs SET content = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (json.dumps(content, ensure_ascii=False), job_id),
+        )
+        await conn.commit()
+
+
+async def finish_broadcast_job(job_id: int, sent: int, failed: int, status: str = "finished"):
+    """Помечает рассылку завершённой и сохраняет итоговые счётчики."""
+    async with _write_connection() as conn:
+        await conn.execute(
+            """
+            UPDATE broadcast_jobs
+            SET status = ?, sent = ?, failed = ?,
+                updated_at = CURRENT_TIMESTAMP,
+                finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            (status, sent, failed, job_id),
+        )
+        await conn.commit()
+
+
+async def set_broadcast_job_status(job_id: int, status: str):
+    """Меняет статус задания рассылки (running/paused), не трогая счётчики."""
+    async with _write_connection() as conn:
+        await conn.execute(
+            "UPDATE broadcast_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (status, job_id),
+        )
+        await conn.commit()
+
+
+def _format_timestamp(value: datetime) -> str:
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Разбирает отметку времени из базы (UTC, формат CURRENT_TIMESTAMP)."""
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+async def fetch_due_broadcast_jobs(now: datetime) -> List[aiosqlite.Row]:
+    """Возвращает запланированные рассылки, время которых наступило к now (UTC)."""
+    async with _read_connection() as conn:
+        cursor = await conn.execute(
+            """
+            SELECT * FROM broadcast_jobs
+            WHERE status = 'scheduled' AND scheduled_at <= ?
+            ORDER BY scheduled_at, id
+            """,
+            (_format_timestamp(now),),
+        )
+        return await cursor.fetchall()
+
+
+async def get_next_broadcast_schedule_time() -> Optional[datetime]:
+    """Возвращает время ближайшей запланированной рассылки (UTC) или None."""
+    async with _read_connection() as conn:
+        cursor = await conn.execute(
+            "SELECT MIN(scheduled_at) AS scheduled_at FROM broadcast_jobs WHERE status = 'scheduled'"
+        )
+        row = await cursor.fetchone()
+    return parse_timestamp(row["scheduled_at"]) if row["scheduled_at"] else None
+
+
+async def start_scheduled_broadcast_job(job_id: int, total: int) -> bool:
+    """Переводит запланированную рассылку в running с пересчитанной аудиторией.
+
+    Возвращает False, если задание уже не в статусе scheduled (например, отменено).
+    """
+    async with _write_connection() as conn:
+        cursor = await conn.execute(
+            """
+            UPDATE broadcast_jobs
+            SET status = 'running', total = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'scheduled'
+            """,
+            (total, job_id),
+        )
+        await conn.commit()
+        return cursor.rowcount == 1
+
+
+async def resume_paused_broadcast_job(job_id: int) -> bool:
+    """Переводит приостановленную рассылку в running.
+
+    Возвращает False, если задание уже не в статусе paused: из двух одновременных
+    «Продолжить» задание запустит только одно.
+    """
+    async with _write_connection() as conn:
+        cursor = await conn.execute(
+            """
+            UPDATE broadcast_jobs
+            SET status = 'running', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'paused'
+            """,
+            (job_id,),
+        )
+        await conn.commit()
+        return cursor.rowcount == 1
+
+
+async def cancel_paused_broadcast_job(job_id: int) -> bool:
+    """Отменяет приостановленную рассылку; False, если её уже продолжили или завершили."""
+    async with _write_connection() as conn:
+        cursor = await conn.execute(
+            """
+            UPDATE broadcast_jobs
+            SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'paused'
+            """,
+            (job_id,),
+        )
+        await conn.commit()
+        return cursor.rowcount == 1
+
+
+async def cancel_scheduled_broadcast_job(job_id: int) -> bool:
+    """Отменяет ещё не начавшуюся рассылку; False, если она уже запущена или завершена."""
+    async with _write_connection() as conn:
+        cursor = await conn.execute(
+            """
+            UPDATE broadcast_jobs
+            SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'scheduled'
+            """,
+            (job_id,),
+        )
+        await conn.commit()
+        return cursor.rowcount == 1
+
+
+async def fetch_recent_broadcast_jobs(limit: int = 10) -> List[aiosqlite.Row]:
+    """Возвращает последние задания рассылки, новые первыми."""
+    async with _read_connection() as conn:
+        cursor = await conn.execute("SELECT * FROM broadcast_jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return await cursor.fetchall()
+
+
+# ── Журнал доставки ───────────────────────────────────────────────────────
+#
+# Итог отправки каждому получателю: status — sent, failed или deleted (сообщение потом
+# удалено администратором), error — код причины неудачи, message_id — ID сообщения у
+# получателя (нужен, чтобы удалить или изменить рассылку); для альбома это первое
+# сообщение, а album_message_ids хранит JSON-список ID всех сообщений альбома. Записи
+# копятся в очереди отложенной записи и пишутся пакетами.
+
+
+async def record_broadcast_delivery(
+    job_id: int,
+    user_id: int,
+    status: str,
+    error: Optional[str] = None,
+    message_ids: Sequence[int] = (),
+):
+    """Записывает итог отправки рассылки одному получателю (через очередь отложенной записи)."""
+    await _write_behind.put(
+        "delivery",
+        (job_id, user_id),
+        (
+            job_id,
+            user_id,
+            status,
+            error,
+            message_ids[0] if message_ids else None,
+            json.dumps(list(message_ids)) if len(message_ids) > 1 else None,
+        ),
+    )
+
+
+async def get_broadcast_failure_stats(job_id: int) -> List[aiosqlite.Row]:
+    """Возвращает количество недоставленных сообщений рассылки по причинам."""
+    await _write_behind.flush()
+    async with _read_connection() as conn:
+        cursor = await conn.execute(
+            """
+            SELECT COALESCE(error, 'unknown') AS error, COUNT(*) AS failed
+            FROM broadcast_deliveries
+            WHERE job_id = ? AND status = 'failed'
+            GROUP BY error
+            ORDER BY failed DESC
+            """,
+            (job_id,),
+        )
+        return await cursor.fetchall()
+
+
+async def set_broadcast_delivery_status(job_id: int, user_id: int, status: str):
+    """Меняет статус записи журнала доставки (через очередь отложенной записи)."""
+    await _write_behind.put("delivery_status", (job_id, user_id), (status, job_id, user_id))
+
+
+async def count_sent_broadcast_messages(job_id: int) -> int:
+    """Возвращает количество доставленных и ещё не удалённых сообщений рассылки."""
+    await _write_behind.flush()
+    async with _read_connection() as conn:
+        cursor = await conn.execute(
+            """
+            SELECT COUNT(*) FROM broadcast_deliveries
+            WHERE job_id = ? AND status = 'sent' AND message_id IS NOT NULL
+            """,
+            (job_id,),
+        )
+        (count,) = await cursor.fetchone()
+        return count
 
 
-# Инициализируем базу при загрузке модуля
-init_db()
+def iter_sent_broadcast_message_batches(
+    job_id: int,
+    after: int = 0,
+    batch_size: int = RECIPIENT_BATCH_SIZE,
+) -> AsyncIterator[List[aiosqlite.Row]]:
+    """Потоково возвращает (user_id, message_id, album_message_ids) доставленных сообщений рассылки."""
+    return _iter_row_batches(
+        """
+        SELECT user_id, message_id, album_message_ids FROM broadcast_deliveries
+        WHERE job_id = ? AND status = 'sent' AND message_id IS NOT NULL AND user_id > ?
+        ORDER BY user_id
+        LIMIT ?
+        """,
+        (job_id,),
+        after,
+        batch_size,
+    )
@@ -1,9 +1,11 @@
 import asyncio
 import logging
-from typing import Optional, Tuple
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 
 from aiogram import types, F
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -15,20 +17,43 @@ from aiogram.types import (
     ReplyKeyboardRemove,
 )
 
-from config import ADMIN_IDS, bot, dp
+from broadcast import (
+    AUDIENCE_ALL,
+    FAILURE_REASONS,
+    JOB_CALLBACK_PREFIX,
+    build_job_controls,
+    build_link_keyboard,
+    cancel_broadcast_job,
+    copy_broadcast_source,
+    edit_broadcast,
+    expression_audience,
+    format_local_time,
+    pause_broadcast_job,
+    resume_broadcast_job,
+    schedule_broadcast_job,
+    start_broadcast_job,
+    unsend_broadcast,
+)
+from config import ADMIN_IDS, BOT_TIMEZONE, api_retries, bot, dp
 from database import (
     add_channel,
     add_subscription_group,
+    count_audience,
+    count_sent_broadcast_messages,
     delete_subscription_group,
     fetch_channel,
+    fetch_broadcast_job,
     fetch_channels,
+    fetch_recent_broadcast_jobs,
     fetch_subscription_group,
     fetch_subscription_groups,
-    get_all_user_ids,
+    get_active_user_count,
+    get_broadcast_failure_stats,
     get_group_stats,
-    get_group_user_ids,
+    get_group_subscriber_count,
     get_reward_stats,
     get_user_count,
+    parse_timestamp,
     set_channel_active,
     update_channel,
     update_subscription_group,
@@ -62,6 +87,7 @@ class BroadcastStates(StatesGroup):
     waiting_for_content = State()
     waiting_for_button = State()
     waiting_for_confirmation = State()
+    waiting_for_schedule = State()
 
 
 class ButtonTitleStates(StatesGroup):
@@ -85,12 +111,17 @@ class DeleteGroupStates(StatesGroup):
     waiting_for_confirmation = State()
 
 
+class SentBroadcastStates(StatesGroup):
+    waiting_for_new_text = State()
+
+
 class GroupBroadcastStates(StatesGroup):
     waiting_for_group_choice = State()
     waiting_for_content_type = State()
     waiting_for_content = State()
     waiting_for_button = State()
     waiting_for_confirmation = State()
+    waiting_for_schedule = State()
 
 
 MAGNET_TYPES = {
@@ -100,13 +131,48 @@ MAGNET_TYPES = {
     "photo": "🖼 Изображение",
 }
 
+JOB_STATUSES = {
+    "scheduled": "запланирована",
+    "running": "идёт",
+    "paused": "на паузе",
+    "finished": "завершена",
+    "cancelled": "отменена",
+    "failed": "прервана ошибкой",
+}
+
 BROADCAST_TYPES = {
     "text": "📝 Текст",
     "photo": "🖼 Фото",
     "video": "🎥 Видео",
     "document": "📎 Файл",
+    "copy": "📋 Любое сообщение или альбом",
 }
 
+COPY_BROADCAST_PROMPT = (
+    "Отправьте сообщение для рассылки: текст с форматированием, любое медиа или альбом. "
+    "Получатели увидят его копию. Не удаляйте исходное сообщение, пока рассылка не завершится."
+)
+
+# Части альбома приходят отдельными сообщениями; ждём остальные столько секунд после первой.
+ALBUM_COLLECT_DELAY = 1.0
+
+_album_parts: Dict[Tuple[int, str], List[int]] = {}
+
+SCHEDULE_PROMPT = (
+    "Когда отправить рассылку? Укажите время по часовому поясу бота ({timezone}): "
+    "«ЧЧ:ММ» или «ДД.ММ ЧЧ:ММ».\n"
+    "Чтобы не нагружать бота в часы пик, отправку можно растянуть: добавьте через пробел "
+    "окно в минутах, например «25.10 10:00 120» — рассылка равномерно распределится на 2 часа."
+)
+
+SCHEDULE_PATTERN = re.compile(
+    r"(?:(?P<day>\d{1,2})\.(?P<month>\d{1,2})(?:\.(?P<year>\d{4}))?\s+)?"
+    r"(?P<hour>\d{1,2}):(?P<minute>\d{2})(?:\s+(?P<window>\d+))?"
+)
+
+# Дольше суток растягивать рассылку незачем.
+MAX_TRICKLE_MINUTES = 24 * 60
+
 
 async def send_admin_menu(event: types.Message | types.CallbackQuery):
     """Отправляет или обновляет главное меню администратора."""
@@ -120,6 +186,7 @@ async def send_admin_menu(event: types.Message | types.CallbackQuery):
             [InlineKeyboardButton(text="👥 Группы подписчиков", callback_data="admin:groups")],
             [InlineKeyboardButton(text="📊 Статистика", callback_data="admin:stats")],
             [InlineKeyboardButton(text="📨 Рассылка всем", callback_data="admin:broadcast")],
+            [InlineKeyboardButton(text="🧾 Отчёты о рассылках", callback_data="admin:reports")],
             [InlineKeyboardButton(text="⬅️ Закрыть панель", callback_data="admin:exit")],
         ]
     )
@@ -216,8 +283,8 @@ def broadcast_type_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def build_channel_list_keyboard(action: str, include_inactive: bool = False) -> InlineKeyboardMarkup:
-    channels = fetch_channels(active_only=not include_inactive)
+async def build_channel_list_keyboard(action: str, include_inactive: bool = False) -> InlineKeyboardMarkup:
+    channels = await fetch_channels(active_only=not include_inactive)
     if not channels:
         return InlineKeyboardMarkup(
             inline_keyboard=[[InlineKeyboardButton(text="🔝 В меню", callback_data="admin:menu")]]
@@ -292,6 +359,133 @@ def extract_magnet_payload(message: types.Message, magnet_type: str) -> Tuple[Op
     return None, None, "Неизвестный тип литмагнита. Начните заново."
 
 
+async def collect_broadcast_source(message: types.Message) -> Optional[List[int]]:
+    """Возвращает ID исходных сообщений для рассылки копией.
+
+    Для альбома результат получает только обработчик первой части — после того как
+    придут остальные; для прочих частей возвращается None.
+    """
+    if not message.media_group_id:
+        return [message.message_id]
+    key = (message.chat.id, message.media_group_id)
+    parts = _album_parts.get(key)
+    if parts is not None:
+        parts.append(message.message_id)
+        return None
+    _album_parts[key] = [message.message_id]
+    await asyncio.sleep(ALBUM_COLLECT_DELAY)
+    return sorted(_album_parts.pop(key))
+
+
+def broadcast_content_from_state(data: dict) -> Optional[dict]:
+    """Собирает содержимое задания рассылки из данных FSM; None, если данных не хватает."""
+    broadcast_type = data.get("broadcast_type")
+    content = {
+        "type": broadcast_type,
+        "button_text": data.get("button_text"),
+        "button_url": data.get("button_url"),
+    }
+    if broadcast_type == "copy":
+        if not data.get("broadcast_message_ids"):
+            return None
+        content.update(
+            from_chat_id=data.get("broadcast_source_chat_id"),
+            message_ids=data.get("broadcast_message_ids"),
+            is_text=data.get("broadcast_is_text", False),
+        )
+        return content
+    if not broadcast_type or not data.get("broadcast_payload"):
+        return None
+    content.update(payload=data.get("broadcast_payload"), caption=data.get("broadcast_caption"))
+    return content
+
+
+async def send_broadcast_preview(message: types.Message, content: dict) -> bool:
+    """Отправляет администратору предпросмотр рассылки. False — неизвестный тип."""
+    markup = build_link_keyboard(content.get("button_text"), content.get("button_url"))
+    broadcast_type = content["type"]
+    if broadcast_type == "copy":
+        await copy_broadcast_source(message.chat.id, content["from_chat_id"], content["message_ids"], markup)
+    elif broadcast_type == "text":
+        await message.answer(content["payload"], reply_markup=markup)
+    elif broadcast_type == "photo":
+        await message.answer_photo(content["payload"], caption=content["caption"], reply_markup=markup)
+    elif broadcast_type == "video":
+        await message.answer_video(content["payload"], caption=content["caption"], reply_markup=markup)
+    elif broadcast_type == "document":
+        await message.answer_document(content["payload"], caption=content["caption"], reply_markup=markup)
+    else:
+        return False
+    return True
+
+
+async def accept_copy_broadcast_source(message: types.Message, state: FSMContext) -> Optional[bool]:
+    """Сохраняет исходное сообщение рассылки копией.
+
+    Возвращает None для не первых частей альбома, True для альбома (кнопку к нему
+    прикрепить нельзя, этот шаг пропускается) и False для одиночного сообщения.
+    """
+    message_ids = await collect_broadcast_source(message)
+    if message_ids is None:
+        return None
+    await state.update_data(
+        broadcast_source_chat_id=message.chat.id,
+        broadcast_message_ids=message_ids,
+        broadcast_is_text=message.text is not None,
+    )
+    if len(message_ids) == 1:
+        return False
+    await state.update_data(button_text=None, button_url=None)
+    await message.answer(
+        f"Альбом из {len(message_ids)} сообщений принят. Кнопку к альбому прикрепить нельзя. "
+        "Формирую предпросмотр.",
+        reply_markup=ReplyKeyboardRemove(),
+    )
+    return True
+
+
+def parse_schedule_text(text: Optional[str]) -> Tuple[Optional[datetime], int, Optional[str]]:
+    """Разбирает ответ администратора: время (UTC) запуска, окно растягивания в секундах и ошибку."""
+    match = SCHEDULE_PATTERN.fullmatch((text or "").strip())
+    if not match:
+        return None, 0, "Не удалось разобрать время. Пример: «18:30» или «25.10 10:00 120»."
+    now = datetime.now(BOT_TIMEZONE)
+    try:
+        run_at = now.replace(
+            year=int(match["year"] or now.year),
+            month=int(match["month"] or now.month),
+            day=int(match["day"] or now.day),
+            hour=int(match["hour"]),
+            minute=int(match["minute"]),
+            second=0,
+            microsecond=0,
+        )
+    except ValueError:
+        return None, 0, "Такой даты или времени не существует."
+    if run_at <= now:
+        # Без даты имеется в виду ближайшее такое время, без года — ближайшая такая дата.
+        if not match["day"]:
+            run_at += timedelta(days=1)
+        elif not match["year"]:
+            try:
+                run_at = run_at.replace(year=run_at.year + 1)
+            except ValueError:
+                return None, 0, "Такой даты не существует в следующем году."
+        else:
+            return None, 0, "Это время уже прошло."
+    window = int(match["window"] or 0)
+    if window > MAX_TRICKLE_MINUTES:
+        return None, 0, f"Окно растягивания не может быть больше {MAX_TRICKLE_MINUTES} минут."
+    return run_at.astimezone(timezone.utc).replace(tzinfo=None), window * 60, None
+
+
+def describe_schedule(run_at: datetime, trickle_seconds: int) -> str:
+    text = f"на {format_local_time(run_at)}"
+    if trickle_seconds:
+        text += f" с растягиванием на {trickle_seconds // 60} мин"
+    return text
+
+
 @dp.message(Command("admin"))
 @admin_only
 async def handle_admin_command(message: types.Message, **_):
@@ -608,12 +802,6 @@ def magnet_type_label(value: str) -> str:
     return MAGNET_TYPES.get(value, value)
 
 
-def build_link_keyboard(text: Optional[str], url: Optional[str]) -> Optional[InlineKeyboardMarkup]:
-    if text and url:
-        return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=text, url=url)]])
-    return None
-
-
 def shorten_text(value: str, limit: int = 120) -> str:
     return value if len(value) <= limit else value[: limit - 1] + "…"
 
@@ -632,7 +820,7 @@ async def finalize_channel_creation(message: types.Message, state: FSMContext):
         await message.answer("Не удалось сохранить канал — данные заполнены не полностью. Попробуйте снова.")
         return
 
-    channel_id = add_channel(
+    channel_id = await add_channel(
         title=channel_title,
         button_title=button_title,
         chat_identifier=str(chat_identifier),
@@ -658,7 +846,7 @@ async def finalize_channel_creation(message: types.Message, state: FSMContext):
 @dp.callback_query(F.data == "admin:list")
 @admin_only
 async def handle_admin_list(call: types.CallbackQuery, state: FSMContext, **_):
-    channels = fetch_channels(active_only=False)
+    channels = await fetch_channels(active_only=False)
     await call.answer()
 
     if not channels:
@@ -685,7 +873,7 @@ async def handle_admin_list(call: types.CallbackQuery, state: FSMContext, **_):
 @admin_only
 async def start_button_title_edit(call: types.CallbackQuery, state: FSMContext, **_):
     await state.clear()
-    channels = fetch_channels(active_only=False)
+    channels = await fetch_channels(active_only=False)
     await call.answer()
 
     if not channels:
@@ -694,7 +882,7 @@ async def start_button_title_edit(call: types.CallbackQuery, state: FSMContext,
 
     await call.message.answer(
         "Выберите канал, для которого нужно задать название кнопки:",
-        reply_markup=build_channel_list_keyboard("admin:button", include_inactive=True),
+        reply_markup=await build_channel_list_keyboard("admin:button", include_inactive=True),
     )
     await state.set_state(ButtonTitleStates.waiting_for_channel_choice)
 
@@ -708,7 +896,7 @@ async def choose_channel_for_button(call: types.CallbackQuery, state: FSMContext
         await call.answer("Не удалось определить канал.", show_alert=True)
         return
 
-    channel = fetch_channel(channel_id)
+    channel = await fetch_channel(channel_id)
     if not channel:
         await call.answer("Канал не найден.", show_alert=True)
         return
@@ -784,7 +972,7 @@ async def process_button_title_edit(message: types.Message, state: FSMContext):
         await send_admin_menu(message)
         return
 
-    updated = update_channel(channel_id, button_title=new_button_title)
+    updated = await update_channel(channel_id, button_title=new_button_title)
     await state.clear()
     if updated:
         await message.answer(
@@ -803,7 +991,7 @@ async def process_button_title_edit(message: types.Message, state: FSMContext):
 @admin_only
 async def start_edit_magnet(call: types.CallbackQuery, state: FSMContext, **_):
     await state.clear()
-    channels = fetch_channels()
+    channels = await fetch_channels()
     await call.answer()
 
     if not channels:
@@ -812,7 +1000,7 @@ async def start_edit_magnet(call: types.CallbackQuery, state: FSMContext, **_):
 
     await call.message.answer(
         "Выберите канал, для которого нужно изменить литмагнит:",
-        reply_markup=build_channel_list_keyboard("admin:edit"),
+        reply_markup=await build_channel_list_keyboard("admin:edit"),
     )
     await state.set_state(EditMagnetStates.waiting_for_channel_choice)
 
@@ -826,7 +1014,7 @@ async def choose_channel_for_edit(call: types.CallbackQuery, state: FSMContext,
         await call.answer("Не удалось определить канал.", show_alert=True)
         return
 
-    channel = fetch_channel(channel_id)
+    channel = await fetch_channel(channel_id)
     if not channel:
         await call.answer("Канал не найден.", show_alert=True)
         return
@@ -969,7 +1157,7 @@ async def finalize_magnet_update(message: types.Message, state: FSMContext):
         await send_admin_menu(message)
         return
 
-    updated = update_channel(
+    updated = await update_channel(
         channel_id,
         magnet_type=magnet_type,
         magnet_payload=magnet_payload,
@@ -995,7 +1183,7 @@ async def finalize_magnet_update(message: types.Message, state: FSMContext):
 @admin_only
 async def start_delete_channel(call: types.CallbackQuery, state: FSMContext, **_):
     await state.clear()
-    channels = fetch_channels()
+    channels = await fetch_channels()
     await call.answer()
 
     if not channels:
@@ -1004,7 +1192,7 @@ async def start_delete_channel(call: types.CallbackQuery, state: FSMContext, **_
 
     await call.message.answer(
         "Выберите канал, который нужно отключить:",
-        reply_markup=build_channel_list_keyboard("admin:delete"),
+        reply_markup=await build_channel_list_keyboard("admin:delete"),
     )
     await state.set_state(DeleteChannelStates.waiting_for_channel_choice)
 
@@ -1018,7 +1206,7 @@ async def confirm_delete_channel(call: types.CallbackQuery, state: FSMContext, *
         await call.answer("Не удалось определить канал.", show_alert=True)
         return
 
-    channel = fetch_channel(channel_id)
+    channel = await fetch_channel(channel_id)
     if not channel:
         await call.answer("Канал не найден.", show_alert=True)
         return
@@ -1061,7 +1249,7 @@ async def complete_delete_channel(call: types.CallbackQuery, state: FSMContext,
         await send_admin_menu(call)
         return
 
-    channel = fetch_channel(channel_id)
+    channel = await fetch_channel(channel_id)
     if not channel:
         await call.answer("Канал не найден.", show_alert=True)
         await state.clear()
@@ -1071,7 +1259,7 @@ async def complete_delete_channel(call: types.CallbackQuery, state: FSMContext,
     await call.answer()
     await state.clear()
 
-    if set_channel_active(channel_id, False):
+    if await set_channel_active(channel_id, False):
         await call.message.answer(f"Канал «{channel['title']}» отключён и исчезнет из меню пользователей.")
     else:
         await call.message.answer("Не удалось обновить статус канала. Повторите попытку.")
@@ -1083,10 +1271,15 @@ async def complete_delete_channel(call: types.CallbackQuery, state: FSMContext,
 @admin_only
 async def handle_admin_stats(call: types.CallbackQuery, state: FSMContext, **_):
     await call.answer()
-    total_users = get_user_count()
-    stats = get_reward_stats()
-
-    lines = [f"Общее количество пользователей: {total_users}"]
+    total_users = await get_user_count()
+    active_users = await get_active_user_count()
+    stats = await get_reward_stats()
+
+    lines = [
+        f"Общее количество пользователей: {total_users}",
+        f"Доступны для рассылки: {active_users}",
+        f"Заблокировали бота или удалили аккаунт: {total_users - active_users}",
+    ]
     if stats:
         lines.append("")
         lines.append("Выданные литмагниты по каналам:")
@@ -1095,6 +1288,15 @@ async def handle_admin_stats(call: types.CallbackQuery, state: FSMContext, **_):
     else:
         lines.append("Литмагниты пока не выдавались.")
 
+    if api_retries.retries or api_retries.exhausted:
+        lines.append("")
+        lines.append("Повторы запросов к Telegram с запуска бота:")
+        for method in sorted(api_retries.retries.keys() | api_retries.exhausted.keys()):
+            line = f"- {method}: {api_retries.retries[method]}"
+            if api_retries.exhausted[method]:
+                line += f" (не удалось выполнить: {api_retries.exhausted[method]})"
+            lines.append(line)
+
     await call.message.answer("\n".join(lines))
 
 
@@ -1131,6 +1333,7 @@ async def set_broadcast_type(call: types.CallbackQuery, state: FSMContext, **_):
         "photo": "Отправьте фотографию с подписью (по желанию).",
         "video": "Отправьте видео с подписью (по желанию).",
         "document": "Отправьте документ с подписью (по желанию).",
+        "copy": COPY_BROADCAST_PROMPT,
     }
     await call.message.answer(
         prompts.get(broadcast_type, "Отправьте содержимое сообщения."),
@@ -1159,18 +1362,27 @@ async def process_broadcast_content(message: types.Message, state: FSMContext):
         await send_admin_menu(message)
         return
 
-    payload, caption, error = extract_magnet_payload(message, broadcast_type)
-    if error:
-        await message.answer(
-            error,
-            reply_markup=build_reply_keyboard(cancel=True, placeholder="Отправьте корректные данные или отмените"),
-        )
-        if error.startswith("Неизвестный"):
-            await state.clear()
-            await send_admin_menu(message)
-        return
+    if broadcast_type == "copy":
+        is_album = await accept_copy_broadcast_source(message, state)
+        if is_album is None:
+            return
+        if is_album:
+            await show_broadcast_preview(message, state)
+            await state.set_state(BroadcastStates.waiting_for_confirmation)
+            return
+    else:
+        payload, caption, error = extract_magnet_payload(message, broadcast_type)
+        if error:
+            await message.answer(
+                error,
+                reply_markup=build_reply_keyboard(cancel=True, placeholder="Отправьте корректные данные или отмените"),
+            )
+            if error.startswith("Неизвестный"):
+                await state.clear()
+                await send_admin_menu(message)
+            return
+        await state.update_data(broadcast_payload=payload, broadcast_caption=caption)
 
-    await state.update_data(broadcast_payload=payload, broadcast_caption=caption)
     await message.answer(
         "Хотите добавить кнопку с ссылкой? Отправьте текст кнопки и ссылку через разделитель `|||`,\n"
         "например: Открыть сайт|||https://example.com\n"
@@ -1242,30 +1454,19 @@ async def process_broadcast_button(message: types.Message, state: FSMContext):
 
 async def show_broadcast_preview(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    broadcast_type = data.get("broadcast_type")
-    payload = data.get("broadcast_payload")
-    caption = data.get("broadcast_caption")
+    content = broadcast_content_from_state(data)
     button_text = data.get("button_text")
     button_url = data.get("button_url")
 
-    if not broadcast_type or not payload:
+    if content is None:
         await message.answer("Не удалось подготовить предварительный просмотр. Рассылка отменена.")
         await state.clear()
         await send_admin_menu(message)
         return
-
-    markup = build_link_keyboard(button_text, button_url)
+    broadcast_type = content["type"]
 
     try:
-        if broadcast_type == "text":
-            await message.answer(payload, reply_markup=markup)
-        elif broadcast_type == "photo":
-            await message.answer_photo(payload, caption=caption, reply_markup=markup)
-        elif broadcast_type == "video":
-            await message.answer_video(payload, caption=caption, reply_markup=markup)
-        elif broadcast_type == "document":
-            await message.answer_document(payload, caption=caption, reply_markup=markup)
-        else:
+        if not await send_broadcast_preview(message, content):
             await message.answer("Неизвестный тип сообщения. Рассылка отменена.")
             await state.clear()
             await send_admin_menu(message)
@@ -1275,7 +1476,7 @@ async def show_broadcast_preview(message: types.Message, state: FSMContext):
         await message.answer("Не удалось сформировать предпросмотр. Проверьте данные и попробуйте снова.")
         return
 
-    total_users = get_user_count()
+    total_users = await get_active_user_count()
     summary = [
         "Предпросмотр отправлен выше.",
         f"Тип: {BROADCAST_TYPES.get(broadcast_type, broadcast_type)}",
@@ -1287,88 +1488,89 @@ async def show_broadcast_preview(message: types.Message, state: FSMContext):
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [InlineKeyboardButton(text="✅ Отправить", callback_data="admin:broadcast:send")],
+            [InlineKeyboardButton(text="🕒 Запланировать", callback_data="admin:broadcast:schedule")],
             [InlineKeyboardButton(text="↩️ Отмена", callback_data="admin:broadcast:cancel")],
         ]
     )
     await message.answer("\n".join(summary), reply_markup=keyboard)
 
 
-async def dispatch_broadcast_to_user(
-    user_id: int,
-    broadcast_type: str,
-    payload: str,
-    caption: Optional[str],
-    markup: Optional[InlineKeyboardMarkup],
-):
-    if broadcast_type == "text":
-        await bot.send_message(user_id, payload, reply_markup=markup)
-    elif broadcast_type == "photo":
-        await bot.send_photo(user_id, payload, caption=caption, reply_markup=markup)
-    elif broadcast_type == "video":
-        await bot.send_video(user_id, payload, caption=caption, reply_markup=markup)
-    elif broadcast_type == "document":
-        await bot.send_document(user_id, payload, caption=caption, reply_markup=markup)
-    else:
-        raise ValueError(f"Unsupported broadcast type: {broadcast_type}")
-
-
 @dp.callback_query(BroadcastStates.waiting_for_confirmation, F.data == "admin:broadcast:send")
 @admin_only
 async def execute_broadcast(call: types.CallbackQuery, state: FSMContext, **_):
     data = await state.get_data()
-    broadcast_type = data.get("broadcast_type")
-    payload = data.get("broadcast_payload")
-    caption = data.get("broadcast_caption")
-    button_text = data.get("button_text")
-    button_url = data.get("button_url")
+    content = broadcast_content_from_state(data)
 
-    if not broadcast_type or not payload:
+    if content is None:
         await call.answer("Недостаточно данных для рассылки.", show_alert=True)
         await state.clear()
         await send_admin_menu(call)
         return
 
-    markup = build_link_keyboard(button_text, button_url)
-    recipients = list(get_all_user_ids())
+    total_recipients = await get_active_user_count()
 
     await call.answer("Рассылка запущена.")
-    status_message = await call.message.answer(f"Отправляю сообщение {len(recipients)} пользователям…")
+    status_message = await call.message.answer(f"Отправляю сообщение {total_recipients} пользователям…")
+    await start_broadcast_job(
+        title="всем пользователям",
+        content=content,
+        audience=AUDIENCE_ALL,
+        status_message=status_message,
+        total=total_recipients,
+    )
+
+    await state.clear()
+    await send_admin_menu(call)
 
-    success = 0
-    failed = 0
 
-    for user_id in recipients:
-        try:
-            await dispatch_broadcast_to_user(user_id, broadcast_type, payload, caption, markup)
-            success += 1
-        except TelegramRetryAfter as exc:
-            await asyncio.sleep(exc.retry_after + 1)
-            try:
-                await dispatch_broadcast_to_user(user_id, broadcast_type, payload, caption, markup)
-                success += 1
-            except Exception as inner_exc:
-                logging.warning("Не удалось отправить сообщение пользователю %s после паузы: %s", user_id, inner_exc)
-                failed += 1
-        except TelegramForbiddenError:
-            failed += 1
-        except TelegramBadRequest as exc:
-            logging.warning("Ошибка отправки пользователю %s: %s", user_id, exc)
-            failed += 1
-        except Exception as exc:
-            logging.error("Неожиданная ошибка при рассылке пользователю %s: %s", user_id, exc)
-            failed += 1
-
-        await asyncio.sleep(0.05)
+@dp.callback_query(BroadcastStates.waiting_for_confirmation, F.data == "admin:broadcast:schedule")
+@admin_only
+async def ask_broadcast_schedule(call: types.CallbackQuery, state: FSMContext, **_):
+    await call.answer()
+    await call.message.answer(
+        SCHEDULE_PROMPT.format(timezone=BOT_TIMEZONE.key),
+        reply_markup=build_reply_keyboard(cancel=True, placeholder="ДД.ММ ЧЧ:ММ [минуты]"),
+    )
+    await state.set_state(BroadcastStates.waiting_for_schedule)
 
-    await state.clear()
 
-    summary = (
-        f"Рассылка завершена.\n"
-        f"Успешно: {success}\n"
-        f"Не доставлено: {failed}"
+@dp.message(BroadcastStates.waiting_for_schedule)
+async def process_broadcast_schedule(message: types.Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        await message.answer("Эта команда доступна только администраторам.", reply_markup=ReplyKeyboardRemove())
+        await state.clear()
+        return
+    if is_cancel_text(message.text):
+        await abort_flow(message, state, "Рассылка отменена.")
+        return
+
+    run_at, trickle_seconds, error = parse_schedule_text(message.text)
+    if error:
+        await message.answer(error, reply_markup=build_reply_keyboard(cancel=True, placeholder="ДД.ММ ЧЧ:ММ [минуты]"))
+        return
+    content = broadcast_content_from_state(await state.get_data())
+    if content is None:
+        await abort_flow(message, state, "Недостаточно данных для рассылки. Рассылка отменена.")
+        return
+
+    total_recipients = await get_active_user_count()
+    schedule = describe_schedule(run_at, trickle_seconds)
+    await message.answer("Принято.", reply_markup=ReplyKeyboardRemove())
+    status_message = await message.answer(
+        f"Рассылка всем пользователям запланирована {schedule}.\nСейчас получателей: {total_recipients}"
+    )
+    await schedule_broadcast_job(
+        title="всем пользователям",
+        content=content,
+        audience=AUDIENCE_ALL,
+        status_message=status_message,
+        total=total_recipients,
+        run_at=run_at,
+        trickle_seconds=trickle_seconds,
     )
-    await status_message.edit_text(summary)
-    await send_admin_menu(call)
+
+    await state.clear()
+    await send_admin_menu(message)
 
 
 @dp.callback_query(BroadcastStates.waiting_for_confirmation, F.data == "admin:broadcast:cancel")
@@ -1380,6 +1582,199 @@ async def cancel_broadcast(call: types.CallbackQuery, state: FSMContext, **_):
     await send_admin_menu(call)
 
 
+# ── Управление идущей рассылкой ─────────────────────────────────────────
+
+
+JOB_ACTIONS = {
+    "pause": (pause_broadcast_job, "Рассылка остановится после текущей пачки получателей."),
+    "resume": (resume_broadcast_job, "Рассылка продолжена."),
+    "cancel": (cancel_broadcast_job, "Рассылка будет отменена."),
+}
+
+
+@dp.callback_query(F.data.startswith(JOB_CALLBACK_PREFIX))
+@admin_only
+async def control_broadcast_job(call: types.CallbackQuery, **_):
+    try:
+        action, job_id_raw = call.data[len(JOB_CALLBACK_PREFIX):].split(":")
+        handler, done_text = JOB_ACTIONS[action]
+        job_id = int(job_id_raw)
+    except (ValueError, KeyError):
+        await call.answer("Не удалось определить рассылку.", show_alert=True)
+        return
+    if await handler(job_id):
+        await call.answer(done_text)
+    else:
+        await call.answer("Действие недоступно: рассылка уже остановлена или завершена.", show_alert=True)
+
+
+# ── Отчёты о рассылках ───────────────────────────────────────────────────
+
+
+@dp.callback_query(F.data == "admin:reports")
+@admin_only
+async def handle_broadcast_reports(call: types.CallbackQuery, **_):
+    jobs = await fetch_recent_broadcast_jobs()
+    await call.answer()
+    if not jobs:
+        await call.message.answer("Рассылок пока не было.")
+        return
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text=f"#{job['id']} {job['title']} — {JOB_STATUSES.get(job['status'], job['status'])}",
+                    callback_data=f"admin:reports:{job['id']}",
+                )
+            ]
+            for job in jobs
+        ]
+    )
+    await call.message.answer("Последние рассылки:", reply_markup=keyboard)
+
+
+@dp.callback_query(F.data.startswith("admin:reports:"))
+@admin_only
+async def show_broadcast_report(call: types.CallbackQuery, **_):
+    try:
+        job_id = int(call.data.split(":")[-1])
+    except ValueError:
+        await call.answer("Не удалось определить рассылку.", show_alert=True)
+        return
+    job = await fetch_broadcast_job(job_id)
+    if not job:
+        await call.answer("Рассылка не найдена.", show_alert=True)
+        return
+    failures = await get_broadcast_failure_stats(job_id)
+    await call.answer()
+
+    lines = [
+        f"Рассылка #{job['id']} {job['title']}",
+        f"Статус: {JOB_STATUSES.get(job['status'], job['status'])}",
+    ]
+    if job["scheduled_at"]:
+        lines.append(f"Запланирована {describe_schedule(parse_timestamp(job['scheduled_at']), job['trickle_seconds'])}")
+    else:
+        lines.append(f"Запущена: {job['created_at']}")
+    lines += [
+        f"Получателей: {job['total']}",
+        f"Успешно: {job['sent']}",
+        f"Не доставлено: {job['failed']}",
+    ]
+    if failures:
+        lines.append("")
+        lines.append("Причины недоставки:")
+        for row in failures:
+            lines.append(f"- {FAILURE_REASONS.get(row['error'], row['error'])}: {row['failed']}")
+    elif job["failed"]:
+        lines.append("Подробный журнал для этой рассылки не сохранился.")
+
+    # Идущей или запланированной рассылкой можно управлять и из отчёта.
+    keyboard = build_job_controls(job_id, job["status"])
+    sent_messages = await count_sent_broadcast_messages(job_id)
+    if sent_messages and job["status"] not in ("running", "paused"):
+        lines.append("")
+        lines.append(f"Сообщений у получателей: {sent_messages}")
+        keyboard = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [InlineKeyboardButton(text="🗑 Удалить у получателей", callback_data=f"admin:sent:unsend:{job_id}")],
+                [InlineKeyboardButton(text="✏️ Изменить текст", callback_data=f"admin:sent:edit:{job_id}")],
+            ]
+        )
+    await call.message.answer("\n".join(lines), reply_markup=keyboard)
+
+
+def parse_job_id(data: str) -> Optional[int]:
+    try:
+        return int(data.split(":")[-1])
+    except ValueError:
+        return None
+
+
+@dp.callback_query(F.data.startswith("admin:sent:unsend:"))
+@admin_only
+async def confirm_unsend_broadcast(call: types.CallbackQuery, **_):
+    job_id = parse_job_id(call.data)
+    if job_id is None:
+        await call.answer("Не удалось определить рассылку.", show_alert=True)
+        return
+    sent_messages = await count_sent_broadcast_messages(job_id)
+    await call.answer()
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="✅ Да, удалить", callback_data=f"admin:sent:unsendconfirm:{job_id}")],
+            [InlineKeyboardButton(text="↩️ Отмена", callback_data="admin:reports")],
+        ]
+    )
+    await call.message.answer(
+        f"Удалить сообщение рассылки #{job_id} у {sent_messages} получателей?\n"
+        "Telegram позволяет удалять сообщения бота только в течение 48 часов после отправки.",
+        reply_markup=keyboard,
+    )
+
+
+@dp.callback_query(F.data.startswith("admin:sent:unsendconfirm:"))
+@admin_only
+async def execute_unsend_broadcast(call: types.CallbackQuery, **_):
+    job_id = parse_job_id(call.data)
+    if job_id is None:
+        await call.answer("Не удалось определить рассылку.", show_alert=True)
+        return
+    sent_messages = await count_sent_broadcast_messages(job_id)
+    status_message = await call.message.answer(f"Удаляю сообщение рассылки у {sent_messages} получателей…")
+    if await unsend_broadcast(job_id, status_message, sent_messages):
+        await call.answer("Удаление запущено.")
+    else:
+        await call.answer("Рассылка ещё идёт или с ней уже выполняется другая операция.", show_alert=True)
+        await status_message.delete()
+
+
+@dp.callback_query(F.data.startswith("admin:sent:edit:"))
+@admin_only
+async def start_edit_sent_broadcast(call: types.CallbackQuery, state: FSMContext, **_):
+    job_id = parse_job_id(call.data)
+    if job_id is None:
+        await call.answer("Не удалось определить рассылку.", show_alert=True)
+        return
+    await state.set_state(SentBroadcastStates.waiting_for_new_text)
+    await state.update_data(sent_job_id=job_id)
+    await call.answer()
+    await call.message.answer(
+        "Пришлите новый текст сообщения (для фото, видео и файлов — новую подпись).",
+        reply_markup=build_reply_keyboard(cancel=True, placeholder="Новый текст или отмена"),
+    )
+
+
+@dp.message(SentBroadcastStates.waiting_for_new_text)
+async def process_edit_sent_broadcast(message: types.Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        await message.answer("Эта команда доступна только администраторам.", reply_markup=ReplyKeyboardRemove())
+        await state.clear()
+        return
+
+    if not message.text:
+        await message.answer(
+            "Пожалуйста, отправьте текст.",
+            reply_markup=build_reply_keyboard(cancel=True, placeholder="Новый текст или отмена"),
+        )
+        return
+
+    if is_cancel_text(message.text):
+        await abort_flow(message, state, "Изменение рассылки отменено.")
+        return
+
+    data = await state.get_data()
+    job_id = data.get("sent_job_id")
+    await state.clear()
+    sent_messages = await count_sent_broadcast_messages(job_id)
+    await message.answer("Новый текст принят.", reply_markup=ReplyKeyboardRemove())
+    # Статусное сообщение отправляется без клавиатуры: иначе его нельзя будет редактировать.
+    status_message = await message.answer(f"Изменяю сообщение рассылки у {sent_messages} получателей…")
+    if not await edit_broadcast(job_id, message.text, status_message, sent_messages):
+        await status_message.edit_text("Рассылка ещё идёт или с ней уже выполняется другая операция.")
+    await send_admin_menu(message)
+
+
 # ═══════════════════════════ Группы подписчиков ═══════════════════════════
 
 
@@ -1407,8 +1802,8 @@ async def send_groups_menu(event: types.Message | types.CallbackQuery):
         await event.answer(text, reply_markup=keyboard)
 
 
-def build_group_list_keyboard(action: str) -> InlineKeyboardMarkup:
-    groups = fetch_subscription_groups()
+async def build_group_list_keyboard(action: str) -> InlineKeyboardMarkup:
+    groups = await fetch_subscription_groups()
     if not groups:
         return InlineKeyboardMarkup(
             inline_keyboard=[[InlineKeyboardButton(text="🔝 Группы", callback_data="admin:groups")]]
@@ -1495,7 +1890,7 @@ async def process_group_description(message: types.Message, state: FSMContext):
     data = await state.get_data()
     name = data.get("group_name", "")
     description = "" if is_skip_text(message.text) else message.text.strip()
-    group_id = add_subscription_group(name, description)
+    group_id = await add_subscription_group(name, description)
     await state.clear()
     await message.answer(
         f"Группа «{name}» создана (ID: {group_id}).",
@@ -1512,13 +1907,13 @@ async def process_group_description(message: types.Message, state: FSMContext):
 async def start_edit_group(call: types.CallbackQuery, state: FSMContext, **_):
     await state.clear()
     await call.answer()
-    groups = fetch_subscription_groups()
+    groups = await fetch_subscription_groups()
     if not groups:
         await call.message.answer("Активных групп нет.")
         return
     await call.message.answer(
         "Выберите группу для редактирования:",
-        reply_markup=build_group_list_keyboard("admin:groups:editchoice"),
+        reply_markup=await build_group_list_keyboard("admin:groups:editchoice"),
     )
     await state.set_state(EditGroupStates.waiting_for_group_choice)
 
@@ -1531,7 +1926,7 @@ async def choose_group_for_edit(call: types.CallbackQuery, state: FSMContext, **
     except (ValueError, IndexError):
         await call.answer("Не удалось определить группу.", show_alert=True)
         return
-    group = fetch_subscription_group(group_id)
+    group = await fetch_subscription_group(group_id)
     if not group:
         await call.answer("Группа не найдена.", show_alert=True)
         return
@@ -1589,7 +1984,7 @@ async def process_edit_group_description(message: types.Message, state: FSMConte
     group_id = data.get("group_id")
     new_name = data.get("group_name", "")
     new_description = data.get("group_description", "") if is_skip_text(message.text) else message.text.strip()
-    updated = update_subscription_group(group_id, name=new_name, description=new_description)
+    updated = await update_subscription_group(group_id, name=new_name, description=new_description)
     await state.clear()
     if updated:
         await message.answer(f"Группа обновлена: «{new_name}».", reply_markup=ReplyKeyboardRemove())
@@ -1606,13 +2001,13 @@ async def process_edit_group_description(message: types.Message, state: FSMConte
 async def start_delete_group(call: types.CallbackQuery, state: FSMContext, **_):
     await state.clear()
     await call.answer()
-    groups = fetch_subscription_groups()
+    groups = await fetch_subscription_groups()
     if not groups:
         await call.message.answer("Активных групп нет.")
         return
     await call.message.answer(
         "Выберите группу для удаления:",
-        reply_markup=build_group_list_keyboard("admin:groups:delchoice"),
+        reply_markup=await build_group_list_keyboard("admin:groups:delchoice"),
     )
     await state.set_state(DeleteGroupStates.waiting_for_group_choice)
 
@@ -1625,11 +2020,11 @@ async def confirm_delete_group(call: types.CallbackQuery, state: FSMContext, **_
     except (ValueError, IndexError):
         await call.answer("Не удалось определить группу.", show_alert=True)
         return
-    group = fetch_subscription_group(group_id)
+    group = await fetch_subscription_group(group_id)
     if not group:
         await call.answer("Группа не найдена.", show_alert=True)
         return
-    subscribers = len(get_group_user_ids(group_id))
+    subscribers = await get_group_subscriber_count(group_id)
     await state.update_data(group_id=group_id, group_name=group["name"])
     await call.answer()
     keyboard = InlineKeyboardMarkup(
@@ -1663,7 +2058,7 @@ async def complete_delete_group(call: types.CallbackQuery, state: FSMContext, **
         await send_groups_menu(call)
         return
     group_name = data.get("group_name", "")
-    deleted = delete_subscription_group(group_id)
+    deleted = await delete_subscription_group(group_id)
     await state.clear()
     await call.answer()
     if deleted:
@@ -1680,7 +2075,7 @@ async def complete_delete_group(call: types.CallbackQuery, state: FSMContext, **
 @admin_only
 async def handle_groups_list(call: types.CallbackQuery, **_):
     await call.answer()
-    groups = fetch_subscription_groups(active_only=False)
+    groups = await fetch_subscription_groups(active_only=False)
     if not groups:
         await call.message.answer("Групп пока нет.")
         return
@@ -1701,8 +2096,8 @@ async def handle_groups_list(call: types.CallbackQuery, **_):
 @admin_only
 async def handle_groups_stats(call: types.CallbackQuery, **_):
     await call.answer()
-    stats = get_group_stats()
-    total_users = get_user_count()
+    stats = await get_group_stats()
+    total_users = await get_user_count()
     lines = [f"Всего пользователей бота: {total_users}", ""]
     if stats:
         lines.append("Подписчики по группам:")
@@ -1724,43 +2119,141 @@ async def handle_groups_stats(call: types.CallbackQuery, **_):
 async def start_group_broadcast(call: types.CallbackQuery, state: FSMContext, **_):
     await state.clear()
     await call.answer()
-    groups = fetch_subscription_groups()
+    groups = await fetch_subscription_groups()
     if not groups:
         await call.message.answer("Нет активных групп для рассылки.")
         return
-    await call.message.answer(
-        "Выберите группу для рассылки:",
-        reply_markup=build_group_list_keyboard("admin:groups:bcast"),
-    )
+    await state.update_data(audience_groups=[], audience_mode="union", audience_exclude_channels=[])
     await state.set_state(GroupBroadcastStates.waiting_for_group_choice)
+    await send_audience_builder(call, state, edit=False)
+
+
+def build_audience_expression(data: dict) -> Optional[dict]:
+    """Собирает выражение аудитории из выбора администратора; None, если группы не выбраны."""
+    leaves = [{"op": "group", "id": group_id} for group_id in data.get("audience_groups") or []]
+    if not leaves:
+        return None
+    expr = leaves[0] if len(leaves) == 1 else {"op": data.get("audience_mode", "union"), "args": leaves}
+    excluded = [{"op": "reward", "id": channel_id} for channel_id in data.get("audience_exclude_channels") or []]
+    if excluded:
+        expr = {
+            "op": "except",
+            "args": [expr, excluded[0] if len(excluded) == 1 else {"op": "union", "args": excluded}],
+        }
+    return expr
+
+
+async def describe_audience(data: dict) -> str:
+    group_names = []
+    for group_id in data.get("audience_groups") or []:
+        group = await fetch_subscription_group(group_id)
+        group_names.append(f"«{group['name']}»" if group else f"#{group_id}")
+    joiner = " или " if data.get("audience_mode", "union") == "union" else " и "
+    description = joiner.join(group_names)
+    channel_titles = []
+    for channel_id in data.get("audience_exclude_channels") or []:
+        channel = await fetch_channel(channel_id)
+        channel_titles.append(f"«{channel['title']}»" if channel else f"#{channel_id}")
+    if channel_titles:
+        description += f", кроме получивших {', '.join(channel_titles)}"
+    return description
+
+
+async def send_audience_builder(call: types.CallbackQuery, state: FSMContext, *, edit: bool):
+    """Показывает (или обновляет) выбор аудитории групповой рассылки с подсчётом получателей."""
+    data = await state.get_data()
+    selected_groups = set(data.get("audience_groups") or [])
+    excluded_channels = set(data.get("audience_exclude_channels") or [])
+    union_mode = data.get("audience_mode", "union") == "union"
+    expr = build_audience_expression(data)
+
+    rows = [
+        [
+            InlineKeyboardButton(
+                text=f"{'✅' if group['id'] in selected_groups else '⬜️'} {group['name']}",
+                callback_data=f"admin:groups:bcast:toggle:{group['id']}",
+            )
+        ]
+        for group in await fetch_subscription_groups()
+    ]
+    rows.append(
+        [
+            InlineKeyboardButton(
+                text="Режим: в любой из групп" if union_mode else "Режим: во всех выбранных группах",
+                callback_data="admin:groups:bcast:mode",
+            )
+        ]
+    )
+    for channel in await fetch_channels():
+        mark = "🚫" if channel["id"] in excluded_channels else "▫️"
+        rows.append(
+            [
+                InlineKeyboardButton(
+                    text=f"{mark} Исключить получивших «{channel['title']}»",
+                    callback_data=f"admin:groups:bcast:exclude:{channel['id']}",
+                )
+            ]
+        )
+    rows.append([InlineKeyboardButton(text="Далее ▶️", callback_data="admin:groups:bcast:next")])
+    rows.append([InlineKeyboardButton(text="🔝 Группы", callback_data="admin:groups")])
+
+    lines = ["Выберите аудиторию рассылки: группы и, при необходимости, исключения."]
+    if expr is not None:
+        lines.append("")
+        lines.append(f"Аудитория: {await describe_audience(data)}")
+        lines.append(f"Получателей: {await count_audience(expr)}")
+    text = "\n".join(lines)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=rows)
+    if not edit:
+        await call.message.answer(text, reply_markup=keyboard)
+        return
+    try:
+        await call.message.edit_text(text, reply_markup=keyboard)
+    except TelegramBadRequest as exc:
+        if "message is not modified" not in str(exc):
+            raise
+
+
+def toggle_id(values: List[int], value: int) -> List[int]:
+    return [item for item in values if item != value] if value in values else values + [value]
 
 
 @dp.callback_query(GroupBroadcastStates.waiting_for_group_choice, F.data.startswith("admin:groups:bcast:"))
 @admin_only
-async def choose_group_for_broadcast(call: types.CallbackQuery, state: FSMContext, **_):
-    parts = call.data.split(":")
-    # admin:groups:bcast:<id> — ровно 4 части
-    if len(parts) != 4:
-        await call.answer("Неизвестная команда.", show_alert=True)
-        return
+async def configure_group_broadcast_audience(call: types.CallbackQuery, state: FSMContext, **_):
+    action, _, raw_id = call.data[len("admin:groups:bcast:"):].partition(":")
+    data = await state.get_data()
     try:
-        group_id = int(parts[-1])
+        if action == "toggle":
+            await state.update_data(audience_groups=toggle_id(data.get("audience_groups") or [], int(raw_id)))
+        elif action == "exclude":
+            await state.update_data(
+                audience_exclude_channels=toggle_id(data.get("audience_exclude_channels") or [], int(raw_id))
+            )
+        elif action == "mode":
+            mode = "intersect" if data.get("audience_mode", "union") == "union" else "union"
+            await state.update_data(audience_mode=mode)
+        elif action != "next":
+            raise ValueError(action)
     except ValueError:
-        await call.answer("Не удалось определить группу.", show_alert=True)
+        await call.answer("Неизвестная команда.", show_alert=True)
         return
-    group = fetch_subscription_group(group_id)
-    if not group:
-        await call.answer("Группа не найдена.", show_alert=True)
+
+    if action != "next":
+        await call.answer()
+        await send_audience_builder(call, state, edit=True)
         return
-    subscribers_count = len(get_group_user_ids(group_id))
-    await state.update_data(
-        target_group_id=group_id,
-        target_group_name=group["name"],
-        target_subscribers=subscribers_count,
-    )
+
+    expr = build_audience_expression(data)
+    if expr is None:
+        await call.answer("Выберите хотя бы одну группу.", show_alert=True)
+        return
+    audience_name = await describe_audience(data)
+    subscribers_count = await count_audience(expr)
+    await state.update_data(target_audience=expr, target_audience_name=audience_name)
     await call.answer()
     await call.message.answer(
-        f"Группа: «{group['name']}» ({subscribers_count} подписчиков)\n\nВыберите тип сообщения:",
+        f"Аудитория: {audience_name} ({subscribers_count} получателей)\n\nВыберите тип сообщения:",
         reply_markup=group_broadcast_type_keyboard(),
     )
     await state.set_state(GroupBroadcastStates.waiting_for_content_type)
@@ -1780,6 +2273,7 @@ async def set_group_broadcast_type(call: types.CallbackQuery, state: FSMContext,
         "photo": "Отправьте фотографию с подписью (по желанию).",
         "video": "Отправьте видео с подписью (по желанию).",
         "document": "Отправьте документ с подписью (по желанию).",
+        "copy": COPY_BROADCAST_PROMPT,
     }
     await call.message.answer(
         prompts.get(broadcast_type, "Отправьте содержимое."),
@@ -1805,17 +2299,26 @@ async def process_group_broadcast_content(message: types.Message, state: FSMCont
         await state.clear()
         await send_groups_menu(message)
         return
-    payload, caption, error = extract_magnet_payload(message, broadcast_type)
-    if error:
-        await message.answer(
-            error,
-            reply_markup=build_reply_keyboard(cancel=True, placeholder="Отправьте корректные данные или отмените"),
-        )
-        if error.startswith("Неизвестный"):
-            await state.clear()
-            await send_groups_menu(message)
-        return
-    await state.update_data(broadcast_payload=payload, broadcast_caption=caption)
+    if broadcast_type == "copy":
+        is_album = await accept_copy_broadcast_source(message, state)
+        if is_album is None:
+            return
+        if is_album:
+            await show_group_broadcast_preview(message, state)
+            await state.set_state(GroupBroadcastStates.waiting_for_confirmation)
+            return
+    else:
+        payload, caption, error = extract_magnet_payload(message, broadcast_type)
+        if error:
+            await message.answer(
+                error,
+                reply_markup=build_reply_keyboard(cancel=True, placeholder="Отправьте корректные данные или отмените"),
+            )
+            if error.startswith("Неизвестный"):
+                await state.clear()
+                await send_groups_menu(message)
+            return
+        await state.update_data(broadcast_payload=payload, broadcast_caption=caption)
     await message.answer(
         "Хотите добавить кнопку со ссылкой? Формат: Текст кнопки|||https://...\n"
         "Если кнопка не нужна — нажмите «Пропустить».",
@@ -1866,31 +2369,21 @@ async def process_group_broadcast_button(message: types.Message, state: FSMConte
 
 async def show_group_broadcast_preview(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    broadcast_type = data.get("broadcast_type")
-    payload = data.get("broadcast_payload")
-    caption = data.get("broadcast_caption")
+    content = broadcast_content_from_state(data)
     button_text = data.get("button_text")
     button_url = data.get("button_url")
-    group_name = data.get("target_group_name", "")
-    subscribers = data.get("target_subscribers", 0)
+    audience = data.get("target_audience")
+    audience_name = data.get("target_audience_name", "")
 
-    if not broadcast_type or not payload:
+    if audience is None or content is None:
         await message.answer("Не удалось подготовить предпросмотр. Рассылка отменена.")
         await state.clear()
         await send_groups_menu(message)
         return
+    broadcast_type = content["type"]
 
-    markup = build_link_keyboard(button_text, button_url)
     try:
-        if broadcast_type == "text":
-            await message.answer(payload, reply_markup=markup)
-        elif broadcast_type == "photo":
-            await message.answer_photo(payload, caption=caption, reply_markup=markup)
-        elif broadcast_type == "video":
-            await message.answer_video(payload, caption=caption, reply_markup=markup)
-        elif broadcast_type == "document":
-            await message.answer_document(payload, caption=caption, reply_markup=markup)
-        else:
+        if not await send_broadcast_preview(message, content):
             await message.answer("Неизвестный тип. Рассылка отменена.")
             await state.clear()
             await send_groups_menu(message)
@@ -1902,9 +2395,9 @@ async def show_group_broadcast_preview(message: types.Message, state: FSMContext
 
     summary = [
         "Предпросмотр отправлен выше.",
-        f"Группа: «{group_name}»",
+        f"Аудитория: {audience_name}",
         f"Тип: {BROADCAST_TYPES.get(broadcast_type, broadcast_type)}",
-        f"Получателей: {subscribers}",
+        f"Получателей: {await count_audience(audience)}",
     ]
     if button_text and button_url:
         summary.append(f"Кнопка: {button_text} → {button_url}")
@@ -1912,6 +2405,7 @@ async def show_group_broadcast_preview(message: types.Message, state: FSMContext
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [InlineKeyboardButton(text="✅ Отправить", callback_data="admin:groups:bcast:send")],
+            [InlineKeyboardButton(text="🕒 Запланировать", callback_data="admin:groups:bcast:schedule")],
             [InlineKeyboardButton(text="↩️ Отмена", callback_data="admin:groups:bcast:cancel")],
         ]
     )
@@ -1922,61 +2416,87 @@ async def show_group_broadcast_preview(message: types.Message, state: FSMContext
 @admin_only
 async def execute_group_broadcast(call: types.CallbackQuery, state: FSMContext, **_):
     data = await state.get_data()
-    target_group_id = data.get("target_group_id")
-    broadcast_type = data.get("broadcast_type")
-    payload = data.get("broadcast_payload")
-    caption = data.get("broadcast_caption")
-    button_text = data.get("button_text")
-    button_url = data.get("button_url")
-    group_name = data.get("target_group_name", "")
+    audience = data.get("target_audience")
+    content = broadcast_content_from_state(data)
+    audience_name = data.get("target_audience_name", "")
 
-    if not target_group_id or not broadcast_type or not payload:
+    if audience is None or content is None:
         await call.answer("Недостаточно данных.", show_alert=True)
         await state.clear()
         await send_groups_menu(call)
         return
 
-    markup = build_link_keyboard(button_text, button_url)
-    recipients = get_group_user_ids(target_group_id)
+    total_recipients = await count_audience(audience)
 
     await call.answer("Рассылка запущена.")
     status_message = await call.message.answer(
-        f"Отправляю сообщение {len(recipients)} подписчикам группы «{group_name}»…"
+        f"Отправляю сообщение {total_recipients} получателям ({audience_name})…"
+    )
+    await start_broadcast_job(
+        title=f"по группам: {audience_name}",
+        content=content,
+        audience=expression_audience(audience),
+        status_message=status_message,
+        total=total_recipients,
     )
 
-    success = 0
-    failed = 0
+    await state.clear()
+    await send_groups_menu(call)
 
-    for user_id in recipients:
-        try:
-            await dispatch_broadcast_to_user(user_id, broadcast_type, payload, caption, markup)
-            success += 1
-        except TelegramRetryAfter as exc:
-            await asyncio.sleep(exc.retry_after + 1)
-            try:
-                await dispatch_broadcast_to_user(user_id, broadcast_type, payload, caption, markup)
-                success += 1
-            except Exception as inner_exc:
-                logging.warning("Ошибка после паузы для %s: %s", user_id, inner_exc)
-                failed += 1
-        except TelegramForbiddenError:
-            failed += 1
-        except TelegramBadRequest as exc:
-            logging.warning("Ошибка отправки пользователю %s: %s", user_id, exc)
-            failed += 1
-        except Exception as exc:
-            logging.error("Неожиданная ошибка при рассылке %s: %s", user_id, exc)
-            failed += 1
-        await asyncio.sleep(0.05)
 
-    await state.clear()
-    summary = (
-        f"Рассылка по группе «{group_name}» завершена.\n"
-        f"Успешно: {success}\n"
-        f"Не доставлено: {failed}"
+@dp.callback_query(GroupBroadcastStates.waiting_for_confirmation, F.data == "admin:groups:bcast:schedule")
+@admin_only
+async def ask_group_broadcast_schedule(call: types.CallbackQuery, state: FSMContext, **_):
+    await call.answer()
+    await call.message.answer(
+        SCHEDULE_PROMPT.format(timezone=BOT_TIMEZONE.key),
+        reply_markup=build_reply_keyboard(cancel=True, placeholder="ДД.ММ ЧЧ:ММ [минуты]"),
     )
-    await status_message.edit_text(summary)
-    await send_groups_menu(call)
+    await state.set_state(GroupBroadcastStates.waiting_for_schedule)
+
+
+@dp.message(GroupBroadcastStates.waiting_for_schedule)
+async def process_group_broadcast_schedule(message: types.Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        await message.answer("Недостаточно прав.", reply_markup=ReplyKeyboardRemove())
+        await state.clear()
+        return
+    if is_cancel_text(message.text):
+        await abort_flow(message, state, "Рассылка отменена.")
+        return
+
+    run_at, trickle_seconds, error = parse_schedule_text(message.text)
+    if error:
+        await message.answer(error, reply_markup=build_reply_keyboard(cancel=True, placeholder="ДД.ММ ЧЧ:ММ [минуты]"))
+        return
+    data = await state.get_data()
+    audience = data.get("target_audience")
+    content = broadcast_content_from_state(data)
+    audience_name = data.get("target_audience_name", "")
+    if audience is None or content is None:
+        await message.answer("Недостаточно данных. Рассылка отменена.", reply_markup=ReplyKeyboardRemove())
+        await state.clear()
+        await send_groups_menu(message)
+        return
+
+    total_recipients = await count_audience(audience)
+    schedule = describe_schedule(run_at, trickle_seconds)
+    await message.answer("Принято.", reply_markup=ReplyKeyboardRemove())
+    status_message = await message.answer(
+        f"Рассылка ({audience_name}) запланирована {schedule}.\nСейчас получателей: {total_recipients}"
+    )
+    await schedule_broadcast_job(
+        title=f"по группам: {audience_name}",
+        content=content,
+        audience=expression_audience(audience),
+        status_message=status_message,
+        total=total_recipients,
+        run_at=run_at,
+        trickle_seconds=trickle_seconds,
+    )
+
+    await state.clear()
+    await send_groups_menu(message)
 
 
 @dp.callback_query(GroupBroadcastStates.waiting_for_confirmation, F.data == "admin:groups:bcast:cancel")
@@ -107,7 +107,7 @@ async def _send_lead_magnet(user_id: int, channel_row) -> bool:
         )
         return False
 
-    record_reward_delivery(user_id, channel_row["id"])
+    await record_reward_delivery(user_id, channel_row["id"])
     await bot.send_message(user_id, REWARD_NAVIGATION_PROMPT, reply_markup=_navigation_keyboard())
     return True
 
@@ -120,7 +120,7 @@ async def handle_menu_callback(call: types.CallbackQuery):
 @dp.callback_query(F.data == "channel:view_rewards")
 async def handle_view_rewards(call: types.CallbackQuery):
     user_id = call.from_user.id
-    rewards = get_user_reward_channels(user_id)
+    rewards = await get_user_reward_channels(user_id)
     await call.answer()
 
     if not rewards:
@@ -153,7 +153,7 @@ async def handle_channel_open(call: types.CallbackQuery):
         await call.answer("Не удалось найти канал.", show_alert=True)
         return
 
-    channel = fetch_channel(channel_id)
+    channel = await fetch_channel(channel_id)
     if not channel or not channel["is_active"]:
         await call.answer("Канал недоступен.", show_alert=True)
         return
@@ -174,7 +174,7 @@ async def handle_channel_check(call: types.CallbackQuery):
         await call.answer("Не удалось проверить канал.", show_alert=True)
         return
 
-    channel = fetch_channel(channel_id)
+    channel = await fetch_channel(channel_id)
     if not channel or not channel["is_active"]:
         await call.answer("Канал недоступен.", show_alert=True)
         return
@@ -199,7 +199,7 @@ async def handle_reward_repeat(call: types.CallbackQuery):
         await call.answer("Не удалось определить канал.", show_alert=True)
         return
 
-    channel = fetch_channel(channel_id)
+    channel = await fetch_channel(channel_id)
     if not channel:
         await call.answer("Канал недоступен.", show_alert=True)
         return
@@ -2,7 +2,7 @@ from aiogram import F, types
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from config import dp
-from database import fetch_subscription_groups, get_user_group_ids, toggle_user_group
+from database import fetch_subscription_groups, get_user_snapshot, toggle_user_group
 
 _ONBOARDING_HEADER = (
     "<b>Из какого вы города?</b>\n\n"
@@ -32,10 +32,10 @@ def _groups_keyboard(groups, subscribed_ids: set) -> InlineKeyboardMarkup:
 
 async def send_city_selection_if_needed(message: types.Message, user_id: int):
     """Показывает выбор города новому пользователю, если он ещё не выбрал группу."""
-    groups = fetch_subscription_groups()
+    groups = await fetch_subscription_groups()
     if not groups:
         return
-    subscribed = set(get_user_group_ids(user_id))
+    subscribed = set((await get_user_snapshot(user_id)).group_ids)
     if subscribed:
         return
     await message.answer(_ONBOARDING_HEADER, reply_markup=_groups_keyboard(groups, subscribed))
@@ -44,11 +44,11 @@ async def send_city_selection_if_needed(message: types.Message, user_id: int):
 
 @dp.callback_query(F.data == "subs:menu")
 async def handle_subs_menu(call: types.CallbackQuery):
-    groups = fetch_subscription_groups()
+    groups = await fetch_subscription_groups()
     if not groups:
         await call.answer(_NO_GROUPS, show_alert=True)
         return
-    subscribed = set(get_user_group_ids(call.from_user.id))
+    subscribed = set((await get_user_snapshot(call.from_user.id)).group_ids)
     await call.answer()
     await call.message.answer(_HEADER, reply_markup=_groups_keyboard(groups, subscribed))
 
@@ -61,9 +61,8 @@ async def handle_subs_toggle(call: types.CallbackQuery):
         await call.answer("Ошибка.", show_alert=True)
         return
 
-    now_on = toggle_user_group(call.from_user.id, group_id)
-    groups = fetch_subscription_groups()
-    subscribed = set(get_user_group_ids(call.from_user.id))
+    now_on, subscribed = await toggle_user_group(call.from_user.id, group_id)
+    groups = await fetch_subscription_groups()
     keyboard = _groups_keyboard(groups, subscribed)
 
     await call.answer("Подписка оформлена ✅" if now_on else "Подписка отменена")
@@ -3,7 +3,7 @@ from aiogram.filters import Command
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from config import dp
-from database import add_user, fetch_channels, get_user_reward_channels
+from database import add_user, fetch_channels, get_user_snapshot
 from handlers.groups import send_city_selection_if_needed
 from messages import NO_CHANNELS_MESSAGE, WELCOME_MESSAGE
 
@@ -28,8 +28,9 @@ def _build_channel_keyboard(channels, include_rewards_button: bool) -> InlineKey
 async def send_channel_menu(target: types.Message | types.CallbackQuery):
     """Отправляет пользователю главное меню с доступными каналами."""
     user_id = target.from_user.id
-    channels = fetch_channels()
-    has_rewards = bool(get_user_reward_channels(user_id))
+    channels = await fetch_channels()
+    snapshot = await get_user_snapshot(user_id)
+    has_rewards = snapshot.has_rewards
 
     if channels:
         keyboard = _build_channel_keyboard(channels, has_rewards)
@@ -54,7 +55,7 @@ async def send_welcome(message: types.Message):
     """Обработчик команды /start."""
     user_id = message.from_user.id
     username = message.from_user.username or ""
-    add_user(user_id, username)
+    await add_user(user_id, username)
     await send_channel_menu(message)
     await send_city_selection_if_needed(message, user_id)
 
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import random
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from ratelimit import KeyedRateLimiter, PriorityTokenBucket, RetryBudget
+
+# Все исходящие запросы бота проходят через RequestRetryMiddleware и OutboundRateLimiter
+# (подключаются к сессии бота в config.py, именно в таком порядке: каждый повтор снова
+# проходит лимиты). Ответы пользователям и рассылки делят один токен, поэтому лимиты
+# Telegram соблюдаются общим ведром, а ответы пользователям идут вне очереди: рассылка
+# отмечает свои запросы приоритетом PRIORITY_BULK (см. broadcast.run_broadcast).
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Приоритет запросов текущей задачи asyncio; по умолчанию — ответ пользователю.
+outbound_priority: ContextVar[int] = ContextVar("outbound_priority", default=PRIORITY_INTERACTIVE)
+
+# Лимиты Telegram касаются сообщений в чатах; служебные запросы (getUpdates,
+# getChatMember, answerCallbackQuery) не ограничиваются.
+CHAT_METHOD_PREFIXES = ("send", "copy", "forward", "edit", "delete")
+
+
+class OutboundRateLimiter(BaseRequestMiddleware):
+    """Промежуточный слой сессии aiogram: общий лимит сообщений бота и лимит на чат.
+
+    Сначала запрос ждёт лимита своего чата (не больше chat_rate сообщений в секунду со
+    всплеском до chat_burst), затем — токена из общего ведра на rate сообщений в секунду,
+    где срочные запросы обслуживаются раньше рассылки.
+    """
+
+    def __init__(self, rate: float, *, chat_rate: float = 1.0, chat_burst: int = 1):
+        self._bucket = PriorityTokenBucket(rate)
+        self._chats = KeyedRateLimiter(chat_rate, chat_burst)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if method.__api_method__.startswith(CHAT_METHOD_PREFIXES):
+            chat_id = getattr(method, "chat_id", None)
+            if chat_id is not None:
+                await self._chats.acquire(chat_id)
+            await self._bucket.acquire(outbound_priority.get())
+        return await make_request(bot, method)
+
+
+class RequestRetryMiddleware(BaseRequestMiddleware):
+    """Промежуточный слой сессии aiogram: повторы запросов после временных сбоев.
+
+    - TelegramRetryAfter: ждём, сколько просит Telegram (плюс немного случайности), если
+      это не дольше max_retry_after. Запросы рассылки не повторяются: ошибка уходит в
+      broadcast._deliver, где общий адаптивный лимит снижает скорость всей рассылки.
+    - Ошибки сервера (5xx) и сети, включая таймауты: экспоненциальная задержка со
+      случайным разбросом (full jitter), не больше max_delay.
+
+    Всего не больше max_attempts попыток на запрос, а повторы по всем запросам ограничены
+    общим бюджетом (RetryBudget). Таймаут не гарантирует, что запрос не дошёл, поэтому
+    после повтора сообщение изредка может прийти дважды. getUpdates не трогаем: у
+    опроса в aiogram своя задержка после ошибок.
+
+    retries — сколько было повторов по каждому методу API, exhausted — сколько запросов
+    так и не удалось выполнить после сбоя (попытки или бюджет кончились).
+    """
+
+    def __init__(
+        self,
+        *,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 10.0,
+        max_retry_after: float = 30.0,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self._budget = budget if budget is not None else RetryBudget()
+        self.retries: Counter[str] = Counter()
+        self.exhausted: Counter[str] = Counter()
+
+    def _may_retry(self, name: str, attempt: int) -> bool:
+        if attempt + 1 >= self.max_attempts or not self._budget.try_spend():
+            self.exhausted[name] += 1
+            return False
+        self.retries[name] += 1
+        return True
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        if name == "getUpdates":
+            return await make_request(bot, method)
+        self._budget.on_request()
+        attempt = 0
+        while True:
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as exc:
+                if outbound_priority.get() == PRIORITY_BULK or exc.retry_after > self.max_retry_after:
+                    raise
+                if not self._may_retry(name, attempt):
+                    raise
+                delay = exc.retry_after + random.uniform(0, self.base_delay)
+                logging.info("%s: flood control, повтор через %.1f с", name, delay)
+            except (TelegramServerError, TelegramNetworkError) as exc:
+                if not self._may_retry(name, attempt):
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+                logging.info("%s: %s, повтор через %.1f с", name, exc, delay)
+            attempt += 1
+            await asyncio.sleep(delay)
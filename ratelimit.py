@@ -0,0 +1,246 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class TokenBucket:
+    """Ограничитель скорости «ведро токенов».
+
+    Пропускает в среднем не более rate операций в секунду; capacity задаёт
+    допустимый всплеск. Ожидающие обслуживаются по очереди (FIFO).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate должен быть положительным")
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else 1.0
+        self._tokens = self._capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def set_rate(self, rate: float):
+        """Меняет скорость на лету; накопленные токены сохраняются."""
+        if rate <= 0:
+            raise ValueError("rate должен быть положительным")
+        self._refill()
+        self._rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        """Ждёт, пока появится токен, и забирает его."""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class AdaptiveRateLimiter:
+    """Ограничитель с подстройкой скорости по обратной связи (AIMD).
+
+    Пока отправки проходят, скорость растёт аддитивно — примерно на increase
+    операций в секунду за каждую секунду работы, но не выше max_rate. На сигнал
+    перегрузки (flood) скорость умножается на decrease, не опускаясь ниже
+    min_rate, а все ожидающие приостанавливаются на указанное сервером время.
+    """
+
+    def __init__(
+        self,
+        max_rate: float,
+        *,
+        min_rate: float = 1.0,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+    ):
+        if not 0 < min_rate <= max_rate:
+            raise ValueError("должно выполняться 0 < min_rate <= max_rate")
+        if not 0 < decrease < 1:
+            raise ValueError("decrease должен быть в интервале (0, 1)")
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._increase = increase
+        self._decrease = decrease
+        self._bucket = TokenBucket(max_rate)
+        self._paused_until = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self._bucket.rate
+
+    @property
+    def paused(self) -> bool:
+        return time.monotonic() < self._paused_until
+
+    async def acquire(self):
+        """Ждёт окончания общей паузы и свободного токена."""
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._bucket.acquire()
+            # Пауза могла начаться, пока мы стояли в очереди за токеном.
+            if not self.paused:
+                return
+
+    def on_success(self):
+        rate = self._bucket.rate
+        if rate < self.max_rate:
+            self._bucket.set_rate(min(self.max_rate, rate + self._increase / rate))
+
+    def on_flood(self, retry_after: float):
+        """Снижает скорость и ставит всех отправителей на паузу на retry_after секунд.
+
+        Несколько отправителей обычно получают flood почти одновременно; скорость
+        снижается только один раз на одну паузу, иначе она схлопнулась бы до минимума.
+        """
+        now = time.monotonic()
+        if now >= self._paused_until:
+            self._bucket.set_rate(max(self.min_rate, self._bucket.rate * self._decrease))
+        self._paused_until = max(self._paused_until, now + retry_after)
+
+
+class PriorityTokenBucket:
+    """Ведро токенов с приоритетами.
+
+    Освободившийся токен получает самый срочный из ожидающих (меньшее значение priority),
+    среди равных — пришедший раньше. Срочный запрос не стоит в очереди за несрочными,
+    а только ждёт ближайшего токена.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate должен быть положительным")
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else 1.0
+        self._tokens = self._capacity
+        self._updated_at = time.monotonic()
+        self._waiters: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._changed = asyncio.Event()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    def _notify(self):
+        # Будит всех ожидающих: каждый проверяет, не он ли теперь первый в очереди.
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def acquire(self, priority: int = 0):
+        """Ждёт своей очереди и свободного токена и забирает его."""
+        entry = (priority, next(self._sequence))
+        heapq.heappush(self._waiters, entry)
+        if self._waiters[0] == entry and len(self._waiters) > 1:
+            self._notify()
+        try:
+            while True:
+                changed = self._changed
+                timeout = None
+                if self._waiters[0] == entry:
+                    self._refill()
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        heapq.heappop(self._waiters)
+                        if self._waiters:
+                            self._notify()
+                        return
+                    timeout = (1 - self._tokens) / self._rate
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._notify()
+            raise
+
+
+class KeyedRateLimiter:
+    """Отдельный лимит скорости для каждого ключа (например, чата).
+
+    В среднем не более rate операций в секунду на ключ, допустимый всплеск — burst.
+    На ключ хранится одно число — время, с которого следующая операция пройдёт без
+    ожидания (алгоритм GCRA); давно не использованные ключи забываются.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, max_keys: int = 10_000):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate должен быть положительным, burst — не меньше 1")
+        self._interval = 1 / rate
+        self._tolerance = (burst - 1) / rate
+        self._max_keys = max_keys
+        self._prune_at = max_keys
+        self._next_at: Dict[Hashable, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._next_at)
+
+    def _prune(self, now: float):
+        # Ключ, у которого время следующей операции уже прошло, ничем не отличается от нового.
+        self._next_at = {key: value for key, value in self._next_at.items() if value > now}
+        self._prune_at = max(self._max_keys, 2 * len(self._next_at))
+
+    async def acquire(self, key: Hashable):
+        """Ждёт, пока операция по ключу уложится в лимит. Место занимается сразу, по порядку вызовов."""
+        now = time.monotonic()
+        next_at = max(self._next_at.get(key, now), now)
+        delay = next_at - self._tolerance - now
+        self._next_at[key] = next_at + self._interval
+        if len(self._next_at) > self._prune_at:
+            self._prune(now)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class RetryBudget:
+    """Бюджет повторов запросов.
+
+    Каждый исходный запрос пополняет бюджет на ratio повтора, кроме того, бюджет
+    пополняется на min_rate повторов в секунду (но не выше capacity); повтор тратит
+    единицу. Когда сбоит сам сервер или сеть, повторы не умножают нагрузку: сверх
+    бюджета ошибка сразу возвращается вызывающему.
+    """
+
+    def __init__(self, ratio: float = 0.2, *, min_rate: float = 5.0, capacity: float = 50.0):
+        self._ratio = ratio
+        self._min_rate = min_rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self, amount: float = 0.0):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._min_rate + amount)
+        self._updated_at = now
+
+    def on_request(self):
+        self._refill(self._ratio)
+
+    def try_spend(self) -> bool:
+        """Забирает единицу на повтор; False, если бюджет исчерпан."""
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
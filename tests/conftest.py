@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Модули бота лежат в корне репозитория, а не в пакете.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config.py требует токен при импорте; запросы к Telegram в тестах не выполняются.
+os.environ.setdefault("TOKEN_BOT", "1:test")
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+import broadcast
+import database
+
+USERS = 40
+
+
+@pytest.fixture
+def run_job(tmp_path, monkeypatch):
+    """Запускает задание рассылки на временной базе; on_send вызывается перед каждой отправкой."""
+    monkeypatch.setattr(broadcast, "JOB_BATCH_SIZE", 5)
+
+    def run(on_send, scenario):
+        async def wrapper():
+            database.DB_PATH = str(tmp_path / "users.db")
+            await database.init_db()
+            try:
+                for user_id in range(1, USERS + 1):
+                    await database.add_user(user_id, f"user{user_id}")
+                await database.flush_pending_writes()
+
+                async def send(user_id, *args):
+                    await on_send(job_id, user_id)
+
+                monkeypatch.setattr(broadcast, "dispatch_broadcast_to_user", send)
+                job_id = await broadcast.start_broadcast_job(
+                    "тест", {"type": "text", "payload": "текст"}, broadcast.AUDIENCE_ALL, None, USERS
+                )
+                await broadcast._running_jobs[job_id].task
+                return await scenario(job_id)
+            finally:
+                await database.close_db()
+
+        return asyncio.run(wrapper())
+
+    return run
+
+
+def test_cancel_overrides_pause_while_batch_is_in_flight(run_job):
+    answers = []
+
+    async def on_send(job_id, user_id):
+        if user_id == 1:
+            answers.append(await broadcast.pause_broadcast_job(job_id))
+            answers.append(await broadcast.cancel_broadcast_job(job_id))
+
+    async def scenario(job_id):
+        return (await database.fetch_broadcast_job(job_id))["status"]
+
+    assert run_job(on_send, scenario) == "cancelled"
+    assert answers == [True, True]
+
+
+def test_cancel_during_pause_checkpoint_is_refused(run_job, monkeypatch):
+    answers = []
+    checkpoint = database.checkpoint_broadcast_job
+
+    async def on_send(job_id, user_id):
+        if user_id == 1:
+            answers.append(await broadcast.pause_broadcast_job(job_id))
+
+    async def checkpoint_then_cancel(job_id, *args):
+        # Отмена приходит, пока задание сохраняет итог паузы.
+        if broadcast._running_jobs[job_id].finishing:
+            answers.append(await broadcast.cancel_broadcast_job(job_id))
+        await checkpoint(job_id, *args)
+
+    monkeypatch.setattr(broadcast, "checkpoint_broadcast_job", checkpoint_then_cancel)
+
+    async def scenario(job_id):
+        paused = (await database.fetch_broadcast_job(job_id))["status"]
+        # Отказ честный: приостановленное задание отменяется следующим нажатием.
+        cancelled = await broadcast.cancel_broadcast_job(job_id)
+        return paused, cancelled, (await database.fetch_broadcast_job(job_id))["status"]
+
+    assert run_job(on_send, scenario) == ("paused", True, "cancelled")
+    assert answers == [True, False]
@@ -0,0 +1,112 @@
+"""Регрессионные проверки планов запросов: горячие пути не должны сканировать большие таблицы.
+
+Каждый тест вызывает настоящую функцию database.py на временной базе, записывает
+выполненные ею SELECT и прогоняет их через EXPLAIN QUERY PLAN.
+"""
+
+import asyncio
+import re
+import sqlite3
+
+import aiosqlite
+import pytest
+
+import database
+
+# Таблицы, растущие вместе с аудиторией: полный проход по ним недопустим.
+HOT_TABLES = {"users", "rewards_history", "user_group_subscriptions", "broadcast_deliveries"}
+
+AUDIENCE = {
+    "op": "except",
+    "args": [
+        {"op": "union", "args": [{"op": "group", "id": 1}, {"op": "group", "id": 2}]},
+        {"op": "reward", "id": 1},
+    ],
+}
+
+
+@pytest.fixture(scope="module")
+def db_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("plans") / "users.db")
+
+    async def prepare():
+        database.DB_PATH = path
+        await database.init_db()
+        channel_id = await database.add_channel("Канал", "Канал", "@channel", None, "text", "текст", None)
+        group_ids = [await database.add_subscription_group(name, "") for name in ("Первая", "Вторая")]
+        for user_id in range(1, 51):
+            await database.add_user(user_id, f"user{user_id}")
+        await database.flush_pending_writes()
+        for user_id in range(1, 51, 2):
+            await database.toggle_user_group(user_id, group_ids[user_id % 2])
+            await database.record_reward_delivery(user_id, channel_id)
+        job_id = await database.create_broadcast_job("тест", {"type": "text"}, {"kind": "all"}, None, None, 50)
+        await database.record_broadcast_delivery(job_id, 1, "sent", message_ids=[10])
+        await database.close_db()
+
+    asyncio.run(prepare())
+    return path
+
+
+def _capture(monkeypatch, db_path, call):
+    """Выполняет call() на временной базе и возвращает выполненные SELECT с параметрами."""
+    statements = []
+    original_execute = aiosqlite.Connection.execute
+
+    def execute(self, sql, parameters=None):
+        if sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((sql, tuple(parameters or ())))
+        return original_execute(self, sql, parameters)
+
+    async def run():
+        database.DB_PATH = db_path
+        await database.open_db()
+        try:
+            result = call()
+            if hasattr(result, "__aiter__"):
+                async for _ in result:
+                    pass
+            else:
+                await result
+        finally:
+            await database.close_db()
+
+    monkeypatch.setattr(aiosqlite.Connection, "execute", execute)
+    asyncio.run(run())
+    monkeypatch.setattr(aiosqlite.Connection, "execute", original_execute)
+    return statements
+
+
+def _full_scans(db_path, sql, params):
+    """Возвращает строки плана с полным проходом по большим таблицам (с учётом псевдонимов)."""
+    aliases = {alias: table for table, alias in re.findall(r"\b(\w+)\s+AS\s+(\w+)", sql)}
+    with sqlite3.connect(db_path) as conn:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    scans = []
+    for detail in plan:
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and aliases.get(match[1], match[1]) in HOT_TABLES:
+            scans.append(detail)
+    return scans
+
+
+# count_audience сюда не входит: подсчёт аудитории по выражению по определению проходит
+# по всем активным пользователям (по частичному индексу) и выполняется один раз перед рассылкой.
+HOT_PATHS = {
+    "iter_all_user_id_batches": lambda: database.iter_all_user_id_batches(),
+    "iter_group_user_id_batches": lambda: database.iter_group_user_id_batches(1),
+    "iter_audience_user_id_batches": lambda: database.iter_audience_user_id_batches(AUDIENCE),
+    "get_user_reward_channels": lambda: database.get_user_reward_channels(1),
+    "get_user_snapshot": lambda: database.get_user_snapshot(3),
+    "get_reward_stats": lambda: database.get_reward_stats(),
+    "get_group_stats": lambda: database.get_group_stats(),
+    "iter_sent_broadcast_message_batches": lambda: database.iter_sent_broadcast_message_batches(1),
+}
+
+
+@pytest.mark.parametrize("name", HOT_PATHS)
+def test_hot_path_avoids_full_table_scans(monkeypatch, db_path, name):
+    statements = _capture(monkeypatch, db_path, HOT_PATHS[name])
+    assert statements, f"{name} не выполнил ни одного SELECT"
+    for sql, params in statements:
+        assert not _full_scans(db_path, sql, params), f"{name}: полный проход по таблице\n{sql}"
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import pytest
+
+from ratelimit import KeyedRateLimiter, PriorityTokenBucket, RetryBudget
+
+INTERACTIVE = 0
+BULK = 1
+
+
+def test_interactive_acquire_overtakes_queued_bulk():
+    async def scenario():
+        bucket = PriorityTokenBucket(rate=50)
+        await bucket.acquire(BULK)  # забираем стартовый токен, дальше все ждут
+        order = []
+
+        async def take(name, priority):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        bulk = [asyncio.create_task(take(f"bulk{i}", BULK)) for i in range(5)]
+        await asyncio.sleep(0)  # рассылка уже стоит в очереди
+        interactive = asyncio.create_task(take("reply", INTERACTIVE))
+        await asyncio.gather(interactive, *bulk)
+        return order
+
+    order = asyncio.run(scenario())
+    assert order[0] == "reply"
+    assert order[1:] == [f"bulk{i}" for i in range(5)]
+
+
+def test_cancelled_waiter_is_removed_from_queue():
+    async def scenario():
+        bucket = PriorityTokenBucket(rate=20)
+        await bucket.acquire()
+        waiting = asyncio.create_task(bucket.acquire(INTERACTIVE))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert bucket._waiters == []
+        # Отменённый ожидающий не должен задерживать следующих.
+        started = time.monotonic()
+        await asyncio.wait_for(bucket.acquire(BULK), timeout=1)
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.2
+
+
+def test_bucket_rate_is_respected():
+    async def scenario():
+        bucket = PriorityTokenBucket(rate=100)
+        started = time.monotonic()
+        await asyncio.gather(*(bucket.acquire(i % 2) for i in range(21)))
+        return time.monotonic() - started
+
+    # Первый токен есть сразу, остальные 20 — по 10 мс.
+    assert asyncio.run(scenario()) >= 0.19
+
+
+def test_chat_limiter_allows_burst_then_spaces_requests():
+    rate, burst = 20.0, 3
+
+    async def scenario():
+        limiter = KeyedRateLimiter(rate, burst)
+        stamps = []
+
+        async def send():
+            await limiter.acquire("chat")
+            stamps.append(time.monotonic())
+
+        started = time.monotonic()
+        await asyncio.gather(*(send() for _ in range(9)))
+        return [stamp - started for stamp in sorted(stamps)]
+
+    stamps = asyncio.run(scenario())
+    assert all(stamp < 0.03 for stamp in stamps[:burst])
+    # В любом окне длиной t проходит не больше burst + t * rate запросов.
+    for i, start in enumerate(stamps):
+        for j in range(i + burst, len(stamps)):
+            assert stamps[j] - start >= (j - i - burst + 1) / rate - 0.01
+
+
+def test_chat_limiter_keeps_chats_independent():
+    async def scenario():
+        limiter = KeyedRateLimiter(1.0, 1)
+        started = time.monotonic()
+        await asyncio.gather(*(limiter.acquire(chat_id) for chat_id in range(50)))
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.1
+
+
+def test_chat_limiter_forgets_idle_chats():
+    async def scenario():
+        limiter = KeyedRateLimiter(1000.0, 1, max_keys=10)
+        for chat_id in range(10):
+            await limiter.acquire(chat_id)
+        await asyncio.sleep(0.01)
+        await limiter.acquire("new")
+        return len(limiter)
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_retry_budget_limits_retries_to_share_of_requests():
+    budget = RetryBudget(ratio=0.2, min_rate=0.0, capacity=2.0)
+    assert budget.try_spend() and budget.try_spend()
+    assert not budget.try_spend()
+    for _ in range(5):
+        budget.on_request()
+    assert budget.try_spend()
+    assert not budget.try_spend()
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import re
+
+import aiosqlite
+import pytest
+
+import database
+
+
+@pytest.fixture
+def run_with_db(tmp_path):
+    """Выполняет сценарий на свежей временной базе с открытым пулом подключений."""
+
+    def run(scenario):
+        async def wrapper():
+            database.DB_PATH = str(tmp_path / "users.db")
+            await database.init_db()
+            try:
+                channel_id = await database.add_channel("Канал", "Канал", "@channel", None, "text", "текст", None)
+                return await scenario(channel_id)
+            finally:
+                await database.close_db()
+
+        return asyncio.run(wrapper())
+
+    return run
+
+
+def make_queue(interval=60.0, max_rows=1000):
+    # Те же операции и в том же порядке, что и у очереди бота.
+    return database._WriteBehindQueue(database._write_behind._statements, interval=interval, max_rows=max_rows)
+
+
+async def fetch_all(sql, params=()):
+    async with database._read_connection() as conn:
+        cursor = await conn.execute(sql, params)
+        return [tuple(row) for row in await cursor.fetchall()]
+
+
+def test_repeated_key_is_merged(run_with_db):
+    async def scenario(_):
+        queue = make_queue()
+        await queue.put("user", 1, (1, "old"))
+        await queue.put("user", 1, (1, "new"))
+        await queue.put("user", 2, (2, "other"))
+        pending = dict(queue.pending("user"))
+        await queue.stop()
+        return pending, await fetch_all("SELECT user_id, username FROM users ORDER BY user_id")
+
+    pending, rows = run_with_db(scenario)
+    assert pending == {1: (1, "new"), 2: (2, "other")}
+    assert rows == [(1, "new"), (2, "other")]
+
+
+def test_users_are_written_before_their_rewards(run_with_db, monkeypatch, caplog):
+    statements = []
+    original_executemany = aiosqlite.Connection.executemany
+
+    def executemany(self, sql, parameters):
+        statements.append(re.search(r"\bINTO\s+(\w+)", sql)[1])
+        return original_executemany(self, sql, parameters)
+
+    monkeypatch.setattr(aiosqlite.Connection, "executemany", executemany)
+
+    async def scenario(channel_id):
+        queue = make_queue()
+        # Награда поставлена в очередь раньше пользователя, на которого ссылается.
+        await queue.put("reward", (7, channel_id), (7, channel_id))
+        await queue.put("user", 7, (7, "user7"))
+        await queue.flush()
+        await queue.stop()
+        return await fetch_all("SELECT user_id, channel_id FROM rewards_history"), channel_id
+
+    with caplog.at_level(logging.ERROR):
+        rewards, channel_id = run_with_db(scenario)
+    assert statements.index("users") < statements.index("rewards_history")
+    assert rewards == [(7, channel_id)]
+    # Пакет записан целиком, без построчного повтора после ошибки внешнего ключа.
+    assert "построчно" not in caplog.text
+
+
+def test_stop_flushes_remaining_rows(run_with_db):
+    async def scenario(channel_id):
+        queue = make_queue(interval=60.0)
+        for user_id in range(1, 6):
+            await queue.put("user", user_id, (user_id, f"user{user_id}"))
+        await queue.put("reward", (1, channel_id), (1, channel_id))
+        before = await fetch_all("SELECT COUNT(*) FROM users")
+        await queue.stop()
+        after = await fetch_all("SELECT COUNT(*) FROM users")
+        rewards = await fetch_all("SELECT COUNT(*) FROM rewards_history")
+        return before, after, rewards, queue.pending("user")
+
+    before, after, rewards, pending = run_with_db(scenario)
+    assert before == [(0,)]
+    assert after == [(5,)]
+    assert rewards == [(1,)]
+    assert pending == {}